@@ -1,34 +1,25 @@
 from __future__ import annotations
 
 import argparse
+import functools
+import itertools
 import shutil
 import subprocess
 import sys
+from collections import Counter
 from pathlib import Path
-from typing import Any
-
-from prereview.annotations import compile_annotations_from_notes
-from prereview.models import FilePatch, Hunk
-from prereview.prepare import (
-    build_review_context,
-    build_source_spec,
-    collect_patch_text_from_source,
-)
-from prereview.review_io import (
-    parse_review_notes_jsonl,
-    rewrite_review_notes_jsonl,
-    render_review_input,
-    write_rejected_notes_jsonl,
-)
+from typing import TYPE_CHECKING, Any
+
 from prereview.skill_install import (
     AGENT_CHOICES,
     SKILL_NAME,
     install_packaged_skill,
     local_target_root,
 )
-from prereview.renderer import render_html
-from prereview.util import ensure_parent, write_json, write_text
-from prereview.validate import evaluate_annotations, materialize_annotations_for_render
+from prereview.util import ensure_parent, write_json, write_text, write_text_chunks
+
+if TYPE_CHECKING:
+    from prereview.models import FilePatch, Hunk
 
 _MAX_UNCOMMENTED_DIFF_LINES_PER_HUNK = 80
 _MAX_UNCOMMENTED_DIFF_CHARS_PER_HUNK = 8_000
@@ -47,14 +38,9 @@ def _ensure_artifacts_workspace(path: Path) -> None:
 
 def _git_exclude_entry(path: Path) -> tuple[Path, str] | None:
     try:
-        repo_root_proc = subprocess.run(
-            ["git", "rev-parse", "--show-toplevel"],
-            check=False,
-            capture_output=True,
-            text=True,
-        )
-        exclude_path_proc = subprocess.run(
-            ["git", "rev-parse", "--git-path", "info/exclude"],
+        # One rev-parse answers both queries, one per output line.
+        rev_parse_proc = subprocess.run(
+            ["git", "rev-parse", "--show-toplevel", "--git-path", "info/exclude"],
             check=False,
             capture_output=True,
             text=True,
@@ -62,10 +48,14 @@ def _git_exclude_entry(path: Path) -> tuple[Path, str] | None:
     except OSError:
         return
 
-    if repo_root_proc.returncode != 0 or exclude_path_proc.returncode != 0:
+    if rev_parse_proc.returncode != 0:
+        return
+    rev_parse_lines = rev_parse_proc.stdout.splitlines()
+    if len(rev_parse_lines) != 2:
         return
+    repo_root_text, exclude_path_text = rev_parse_lines
 
-    repo_root = Path(repo_root_proc.stdout.strip())
+    repo_root = Path(repo_root_text.strip())
     if not repo_root.is_absolute():
         return
 
@@ -79,7 +69,7 @@ def _git_exclude_entry(path: Path) -> tuple[Path, str] | None:
         return None
 
     ignore_pattern = f"/{normalized}/"
-    exclude_path = Path(exclude_path_proc.stdout.strip())
+    exclude_path = Path(exclude_path_text.strip())
     if not exclude_path.is_absolute():
         exclude_path = (Path.cwd() / exclude_path).resolve()
     return exclude_path, ignore_pattern
@@ -110,10 +100,10 @@ def _remove_git_info_exclude(path: Path) -> None:
     if entry is None:
         return
     exclude_path, ignore_pattern = entry
-    if not exclude_path.exists():
+    try:
+        lines = exclude_path.read_text(encoding="utf-8").splitlines()
+    except FileNotFoundError:
         return
-
-    lines = exclude_path.read_text(encoding="utf-8").splitlines()
     filtered = [line for line in lines if line != ignore_pattern]
     if filtered == lines:
         return
@@ -187,15 +177,6 @@ def _render_uncommented_diff_lines(
     return rendered, used_chars, truncated
 
 
-def _runtime_hunks_by_stable_id(
-    runtime: dict[str, Any],
-) -> dict[str, dict[str, Hunk]]:
-    return {
-        file_entry.path: {hunk.stable_hunk_id: hunk for hunk in file_entry.hunks}
-        for file_entry in runtime["files"]
-    }
-
-
 def _runtime_files_payload(runtime_files: list[FilePatch]) -> list[dict[str, object]]:
     return [file_patch.to_dict() for file_patch in runtime_files]
 
@@ -213,7 +194,7 @@ def _collect_anchor_states(
 
     anchor_states: dict[str, dict[str, Any]] = {}
     anchor_index = runtime["anchor_index"]
-    hunk_index = _runtime_hunks_by_stable_id(runtime)
+    hunks_by_anchor = runtime["hunks_by_anchor"]
     remaining_chars_budget = _MAX_UNCOMMENTED_DIFF_TOTAL_CHARS
 
     for file_entry in context["files"]:
@@ -230,8 +211,7 @@ def _collect_anchor_states(
             }
 
             if state["uncommented"]:
-                stable_hunk_id = runtime_meta["stable_hunk_id"]
-                hunk = hunk_index[path][stable_hunk_id]
+                hunk = hunks_by_anchor[anchor_id]
                 if hunk:
                     max_chars = min(
                         _MAX_UNCOMMENTED_DIFF_CHARS_PER_HUNK,
@@ -261,6 +241,30 @@ def _collect_anchor_states(
 
 
 def _run_cmd(args: argparse.Namespace) -> int:
+    # Deferred so argument errors, clean and install-skill skip loading the
+    # pipeline and jinja2.
+    from prereview.prepare import shared_parse_cache
+
+    with shared_parse_cache():
+        return _run_pipeline(args)
+
+
+def _run_pipeline(args: argparse.Namespace) -> int:
+    from prereview.annotations import compile_annotations_from_notes
+    from prereview.prepare import (
+        build_review_context,
+        build_source_spec,
+        collect_patch_text_from_source,
+    )
+    from prereview.renderer import render_html_chunks
+    from prereview.review_io import (
+        parse_review_notes_jsonl,
+        render_review_input,
+        rewrite_review_notes_jsonl,
+        write_rejected_notes_jsonl,
+    )
+    from prereview.validate import evaluate_and_materialize
+
     artifacts_dir = args.artifacts_dir
     _ensure_artifacts_workspace(artifacts_dir)
     _ensure_git_info_exclude(artifacts_dir)
@@ -281,21 +285,27 @@ def _run_cmd(args: argparse.Namespace) -> int:
     html_path = artifacts_dir / "review.html"
 
     write_json(context_path, context)
-    if not notes_path.exists():
-        write_text(notes_path, "")
+    # Read notes once; parsing and rejected-line rewriting share the text.
+    if notes_path.exists():
+        notes_text = notes_path.read_text(encoding="utf-8")
+    else:
+        notes_text = ""
+        write_text(notes_path, notes_text)
 
     notes_payload, notes_issues, rejected_records = parse_review_notes_jsonl(
-        notes_path, context
+        notes_path, context, text=notes_text
     )
     if rejected_records:
-        rewrite_review_notes_jsonl(notes_path, rejected_records)
+        rewrite_review_notes_jsonl(notes_path, rejected_records, text=notes_text)
     write_rejected_notes_jsonl(rejected_path, rejected_records)
 
     annotations, compile_issues = compile_annotations_from_notes(context, notes_payload)
     write_json(annotations_path, annotations)
 
-    report, runtime = evaluate_annotations(context, annotations, strict=False)
-    if runtime is None:
+    report, runtime, render_annotations = evaluate_and_materialize(
+        context, annotations, strict=False
+    )
+    if runtime is None or render_annotations is None:
         raise SystemExit(
             "Cannot build preview because runtime diff recomputation failed."
         )
@@ -312,13 +322,12 @@ def _run_cmd(args: argparse.Namespace) -> int:
 
     notes_diagnostics = [
         normalized
-        for raw_issue in [*notes_issues, *compile_issues]
+        for raw_issue in itertools.chain(notes_issues, compile_issues)
         if (normalized := _normalize_issue(raw_issue)) is not None
     ]
-    notes_error_count = sum(issue["level"] == "error" for issue in notes_diagnostics)
-    notes_warning_count = sum(
-        issue["level"] == "warning" for issue in notes_diagnostics
-    )
+    notes_level_counts = Counter(issue["level"] for issue in notes_diagnostics)
+    notes_error_count = notes_level_counts["error"]
+    notes_warning_count = notes_level_counts["warning"]
 
     runtime_issues = report["issues"]
     normalized_runtime_issues = [
@@ -335,8 +344,7 @@ def _run_cmd(args: argparse.Namespace) -> int:
         "stats": report["stats"],
     }
 
-    render_annotations = materialize_annotations_for_render(runtime, annotations)
-    html = render_html(
+    html_chunks = render_html_chunks(
         {
             "stats": runtime["stats"],
             "files": _runtime_files_payload(runtime["files"]),
@@ -356,7 +364,7 @@ def _run_cmd(args: argparse.Namespace) -> int:
             "validation_report": report,
         },
     )
-    write_text(html_path, html)
+    write_text_chunks(html_path, html_chunks)
 
     stats = context["stats"]
     uncommented_states = [
@@ -390,14 +398,19 @@ def _clean_cmd(args: argparse.Namespace) -> int:
     artifacts_dir = args.artifacts_dir
     _remove_git_info_exclude(artifacts_dir)
 
-    if artifacts_dir.exists():
-        if artifacts_dir.is_dir():
-            shutil.rmtree(artifacts_dir)
-        else:
+    # rmtree refuses symlinks, so unlink those (whatever they point at) first;
+    # otherwise let rmtree report what is there instead of stat-ing up front.
+    try:
+        if artifacts_dir.is_symlink():
             artifacts_dir.unlink()
-        print(f"Removed artifacts workspace: {artifacts_dir}")
-    else:
+        else:
+            shutil.rmtree(artifacts_dir)
+    except FileNotFoundError:
         print(f"No artifacts workspace found at: {artifacts_dir}")
+        return 0
+    except NotADirectoryError:
+        artifacts_dir.unlink()
+    print(f"Removed artifacts workspace: {artifacts_dir}")
     return 0
 
 
@@ -513,8 +526,15 @@ def build_parser() -> argparse.ArgumentParser:
     return parser
 
 
+@functools.cache
+def _cached_parser() -> argparse.ArgumentParser:
+    # parse_args does not mutate the parser, so in-process callers that invoke
+    # main repeatedly can share one parser tree.
+    return build_parser()
+
+
 def main(argv: list[str] | None = None) -> int:
-    parser = build_parser()
+    parser = _cached_parser()
     args = parser.parse_args(argv if argv is not None else sys.argv[1:])
     return args.func(args)
 
@@ -1,30 +1,29 @@
 from __future__ import annotations
 
 import re
-from dataclasses import replace
+import sys
 
 from prereview.models import FilePatch, Hunk, Line
 from prereview.util import hash_text
 
 _DIFF_GIT_RE = re.compile(r"^diff --git (.+) (.+)$")
 _HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@(.*)$")
-_DIFF_PREFIXES = {"a", "b", "i", "w", "c", "o", "1", "2"}
-_LINE_PREFIX_BY_TYPE = {"add": "+", "del": "-", "context": " "}
+# Mnemonic (a/b/i/w/c/o) and --no-index (1/2) prefixes, plus leading "./".
+_PATH_PREFIX_RE = re.compile(r"^(?:[abiwco12]/)?(?:\./)*")
+# One C-level match classifies a header line and rejects noise like "index".
+_HEADER_LINE_RE = re.compile(
+    r"diff --git |new file mode |deleted file mode |rename from |rename to "
+    r"|Binary files |GIT binary patch|--- |\+\+\+ |@@ "
+)
 
 
 def _normalize_path(value: str) -> str:
     path = value.strip()
     if path.startswith('"') and path.endswith('"') and len(path) >= 2:
         path = path[1:-1]
-
-    if "/" in path:
-        prefix, remainder = path.split("/", 1)
-        if prefix in _DIFF_PREFIXES:
-            path = remainder
-
-    while path.startswith("./"):
-        path = path[2:]
-    return path
+    # Each path shows up in several headers; intern it so the diff --git,
+    # ---/+++ and rename spellings share one object per file.
+    return sys.intern(_PATH_PREFIX_RE.sub("", path, count=1))
 
 
 def _normalize_header_path(value: str) -> str | None:
@@ -34,28 +33,20 @@ def _normalize_header_path(value: str) -> str | None:
     return _normalize_path(path)
 
 
-def _stable_hunk_signature(header: str, lines: list[Line]) -> str:
-    parts = [header]
-    for line in lines:
-        prefix = _LINE_PREFIX_BY_TYPE[line.line_type]
-        parts.append(f"{prefix}{line.content}")
-    return "\n".join(parts)
-
-
-def _with_stable_hunk_ordinals(file_patch: FilePatch) -> FilePatch:
+def _finalize_file_patch(file_patch: FilePatch) -> FilePatch:
+    canonical_path = file_patch.new_path or file_patch.old_path or file_patch.path
+    file_patch.file_id = hash_text(canonical_path)
+    file_patch.path = canonical_path
+    # Identical hunks in one file are told apart by their occurrence ordinal,
+    # counted in a single pass. The patch and its hunks were built by this
+    # parser and are not shared yet, so they are updated in place.
     seen_by_signature: dict[str, int] = {}
-    normalized_hunks: list[Hunk] = []
     for hunk in file_patch.hunks:
         base_signature_id = hunk.stable_hunk_id
         ordinal = seen_by_signature.get(base_signature_id, 0) + 1
         seen_by_signature[base_signature_id] = ordinal
-        normalized_hunks.append(
-            replace(
-                hunk,
-                stable_hunk_id=hash_text(f"{base_signature_id}:{ordinal}"),
-            )
-        )
-    return replace(file_patch, hunks=normalized_hunks)
+        hunk.stable_hunk_id = hash_text(f"{base_signature_id}:{ordinal}")
+    return file_patch
 
 
 def _parse_hunk(lines: list[str], start: int, file_path: str) -> tuple[Hunk, int]:
@@ -73,17 +64,18 @@ def _parse_hunk(lines: list[str], start: int, file_path: str) -> tuple[Hunk, int
     old_line = old_start
     new_line = new_start
     parsed_lines: list[Line] = []
+    # The stable id hashes the header plus each body line with its diff prefix;
+    # raw +/- lines already have that form, so collect them as they are seen.
+    signature_parts = [trailing_header]
 
+    line_count = len(lines)
     idx = start + 1
-    while idx < len(lines):
+    while idx < line_count:
         line = lines[idx]
-        if line.startswith("diff --git ") or line.startswith("@@ "):
-            break
-        if line.startswith("\\ No newline at end of file"):
-            idx += 1
-            continue
-
-        if line.startswith("+") and not line.startswith("+++ "):
+        # Body lines dominate hunks, so classify them by their first character
+        # before checking for the rarer hunk terminators and "no newline" markers.
+        first = line[:1]
+        if first == "+" and not line.startswith("+++ "):
             content = line[1:]
             line_key = f"{file_path}:add:{new_line}:{content}"
             parsed_lines.append(
@@ -95,8 +87,9 @@ def _parse_hunk(lines: list[str], start: int, file_path: str) -> tuple[Hunk, int
                     new_line=new_line,
                 )
             )
+            signature_parts.append(line)
             new_line += 1
-        elif line.startswith("-") and not line.startswith("--- "):
+        elif first == "-" and not line.startswith("--- "):
             content = line[1:]
             line_key = f"{file_path}:del:{old_line}:{content}"
             parsed_lines.append(
@@ -108,9 +101,15 @@ def _parse_hunk(lines: list[str], start: int, file_path: str) -> tuple[Hunk, int
                     new_line=None,
                 )
             )
+            signature_parts.append(line)
             old_line += 1
+        elif first in "d@" and line.startswith(("diff --git ", "@@ ")):
+            break
+        elif first == "\\" and line.startswith("\\ No newline at end of file"):
+            idx += 1
+            continue
         else:
-            content = line[1:] if line.startswith(" ") else line
+            content = line[1:] if first == " " else line
             line_key = f"{file_path}:ctx:{old_line}:{new_line}:{content}"
             parsed_lines.append(
                 Line(
@@ -121,6 +120,7 @@ def _parse_hunk(lines: list[str], start: int, file_path: str) -> tuple[Hunk, int
                     new_line=new_line,
                 )
             )
+            signature_parts.append(line if first == " " else f" {line}")
             old_line += 1
             new_line += 1
         idx += 1
@@ -130,7 +130,7 @@ def _parse_hunk(lines: list[str], start: int, file_path: str) -> tuple[Hunk, int
     )
     hunk = Hunk(
         hunk_id=hash_text(hunk_key),
-        stable_hunk_id=hash_text(_stable_hunk_signature(trailing_header, parsed_lines)),
+        stable_hunk_id=hash_text("\n".join(signature_parts)),
         old_start=old_start,
         old_count=old_count,
         new_start=new_start,
@@ -146,21 +146,26 @@ def parse_unified_diff(raw_patch: str) -> list[FilePatch]:
         return []
 
     lines = raw_patch.splitlines()
+    line_count = len(lines)
     files: list[FilePatch] = []
     current: FilePatch | None = None
 
     idx = 0
-    while idx < len(lines):
+    while idx < line_count:
         line = lines[idx]
+        header_match = _HEADER_LINE_RE.match(line)
+        if header_match is None:
+            idx += 1
+            continue
+        kind = header_match.group()
 
-        if line.startswith("diff --git "):
+        if kind == "diff --git ":
             if current is not None:
-                files.append(current)
+                files.append(_finalize_file_patch(current))
 
             old_path: str | None = None
             new_path: str | None = None
-            match = _DIFF_GIT_RE.match(line)
-            if match:
+            if match := _DIFF_GIT_RE.match(line):
                 old_path = _normalize_path(match.group(1))
                 new_path = _normalize_path(match.group(2))
 
@@ -179,23 +184,31 @@ def parse_unified_diff(raw_patch: str) -> list[FilePatch]:
             idx += 1
             continue
 
-        if line.startswith("new file mode "):
+        value = line[header_match.end() :]
+        if kind == "new file mode ":
             current.is_new = True
-        elif line.startswith("deleted file mode "):
+        elif kind == "deleted file mode ":
             current.is_deleted = True
-        elif line.startswith("rename from "):
+        elif kind == "rename from ":
             current.is_rename = True
-            current.old_path = _normalize_path(line.removeprefix("rename from "))
-        elif line.startswith("rename to "):
+            current.old_path = _normalize_path(value)
+        elif kind == "rename to ":
             current.is_rename = True
-            current.new_path = _normalize_path(line.removeprefix("rename to "))
-        elif line.startswith("Binary files "):
+            current.new_path = _normalize_path(value)
+        elif kind == "Binary files ":
+            current.is_binary = True
+        elif kind == "GIT binary patch":
+            # Skip the base85 payload wholesale; binary files never get hunks.
             current.is_binary = True
-        elif line.startswith("--- "):
-            current.old_path = _normalize_header_path(line.removeprefix("--- "))
-        elif line.startswith("+++ "):
-            current.new_path = _normalize_header_path(line.removeprefix("+++ "))
-        elif line.startswith("@@ "):
+            idx += 1
+            while idx < line_count and not lines[idx].startswith("diff --git "):
+                idx += 1
+            continue
+        elif kind == "--- ":
+            current.old_path = _normalize_header_path(value)
+        elif kind == "+++ ":
+            current.new_path = _normalize_header_path(value)
+        else:
             hunk, idx = _parse_hunk(lines, idx, current.path)
             current.hunks.append(hunk)
             continue
@@ -203,16 +216,6 @@ def parse_unified_diff(raw_patch: str) -> list[FilePatch]:
         idx += 1
 
     if current is not None:
-        files.append(current)
-
-    normalized_files: list[FilePatch] = []
-    for file_patch in files:
-        canonical_path = file_patch.new_path or file_patch.old_path or file_patch.path
-        file_id = hash_text(canonical_path)
-        normalized_files.append(
-            _with_stable_hunk_ordinals(
-                replace(file_patch, file_id=file_id, path=canonical_path)
-            )
-        )
+        files.append(_finalize_file_patch(current))
 
-    return normalized_files
+    return files
@@ -1,11 +1,17 @@
 from __future__ import annotations
 
+import contextlib
 import fnmatch
+import functools
 import json
+import os
+import re
+import stat
 import subprocess
+from collections.abc import Iterator, Sequence
 from pathlib import PurePosixPath
 from pathlib import Path
-from typing import Any
+from typing import Any, Protocol
 
 from prereview.diff_parser import parse_unified_diff
 from prereview.models import FilePatch, Hunk, Line
@@ -15,10 +21,28 @@ _MAX_UNTRACKED_FILE_BYTES = 8 * 1024 * 1024
 _MAX_UNTRACKED_FILE_PATCH_BYTES = 8 * 1024 * 1024
 _MAX_UNTRACKED_PATCH_BYTES = 24 * 1024 * 1024
 _MAX_TRACKED_PATCH_BYTES = 24 * 1024 * 1024
+_GIT_SOURCE_MODES = frozenset({"git-range", "working-tree"})
 
 
-def _run_git_command(args: list[str], *, max_output_bytes: int | None = None) -> str:
+class _GitRunner(Protocol):
+    def __call__(
+        self,
+        args: list[str],
+        *,
+        max_output_bytes: int | None = None,
+        stdin: str | None = None,
+    ) -> str: ...
+
+
+def _run_git_command(
+    args: list[str],
+    *,
+    max_output_bytes: int | None = None,
+    stdin: str | None = None,
+) -> str:
     if max_output_bytes is not None:
+        if stdin is not None:
+            raise ValueError("stdin is not supported with max_output_bytes")
         proc = subprocess.Popen(
             ["git", *args],
             stdout=subprocess.PIPE,
@@ -27,35 +51,36 @@ def _run_git_command(args: list[str], *, max_output_bytes: int | None = None) ->
         if proc.stdout is None:
             raise RuntimeError("git command did not provide stdout stream")
 
-        chunks: list[bytes] = []
-        total_bytes = 0
-        while True:
-            chunk = proc.stdout.read(64 * 1024)
-            if not chunk:
-                break
-            total_bytes += len(chunk)
-            if total_bytes > max_output_bytes:
+        # Grow one buffer in place; joining a chunk list would briefly hold
+        # the whole patch twice before decoding.
+        buffer = bytearray()
+        while chunk := proc.stdout.read(64 * 1024):
+            buffer += chunk
+            if len(buffer) > max_output_bytes:
                 proc.kill()
                 proc.wait()
                 raise RuntimeError(
                     "Diff output exceeded safe size budget "
                     f"({max_output_bytes} bytes). Narrow scope with --include."
                 )
-            chunks.append(chunk)
 
         returncode = proc.wait()
-        output = b"".join(chunks).decode("utf-8", errors="replace")
+        output = buffer.decode("utf-8", errors="replace")
         if returncode not in {0, 1}:
             raise RuntimeError(
                 output.strip() or f"git command failed: {' '.join(args)}"
             )
         return output
 
+    # surrogateescape keeps non-UTF-8 bytes (e.g. in `-z` file names) intact
+    # so they round-trip through os.fsencode instead of failing to decode.
     proc = subprocess.run(
         ["git", *args],
         check=False,
         capture_output=True,
-        text=True,
+        input=stdin,
+        encoding="utf-8",
+        errors="surrogateescape",
     )
     if proc.returncode not in {0, 1}:
         raise RuntimeError(
@@ -68,47 +93,167 @@ def _read_patch_file(path: Path) -> str:
     return path.read_text(encoding="utf-8")
 
 
-def _build_untracked_patch(include_paths: list[str]) -> str:
-    names = _run_git_command(
-        ["ls-files", "--others", "--exclude-standard"]
-    ).splitlines()
-    chunks: list[str] = []
-    total_bytes = 0
+# Bytes git's default core.quotePath wraps in C-style quotes.
+_GIT_QUOTE_RE = re.compile(rb'[\x00-\x1f"\\\x7f-\xff]')
+_GIT_QUOTE_ESCAPES = {
+    0x07: b"\\a",
+    0x08: b"\\b",
+    0x09: b"\\t",
+    0x0A: b"\\n",
+    0x0B: b"\\v",
+    0x0C: b"\\f",
+    0x0D: b"\\r",
+    0x22: b'\\"',
+    0x5C: b"\\\\",
+}
+
+
+def _git_quote_path(path: bytes) -> bytes:
+    if _GIT_QUOTE_RE.search(path) is None:
+        return path
+    escaped = _GIT_QUOTE_RE.sub(
+        lambda match: _GIT_QUOTE_ESCAPES.get(match[0][0], b"\\%03o" % match[0][0]),
+        path,
+    )
+    return b'"%s"' % escaped
+
+
+def _untracked_file_patch(
+    name: str, data: bytes, mode: int, *, is_binary: bool | None = None
+) -> bytes:
+    # Mirrors `git diff --no-index -- /dev/null <name>` (minus the index line)
+    # so untracked files don't each cost a git subprocess. For symlinks, data
+    # is the link target, as git records it. is_binary carries the file's
+    # `diff` attribute when set; None falls back to git's content heuristic.
+    name_bytes = os.fsencode(name)
+    old_name = _git_quote_path(b"a/" + name_bytes)
+    new_name = _git_quote_path(b"b/" + name_bytes)
+    if stat.S_ISLNK(mode):
+        file_mode = b"120000"
+    elif mode & stat.S_IXUSR:
+        file_mode = b"100755"
+    else:
+        file_mode = b"100644"
+    header = b"diff --git %s %s\nnew file mode %s\n" % (old_name, new_name, file_mode)
+    if not data:
+        return header
+    if is_binary is None:
+        # Same heuristic as git: a NUL byte in the first 8000 bytes means binary.
+        is_binary = b"\0" in data[:8000]
+    if is_binary:
+        return header + b"Binary files /dev/null and %s differ\n" % new_name
+
+    has_final_newline = data.endswith(b"\n")
+    body = data[:-1] if has_final_newline else data
+    count = body.count(b"\n") + 1
+    hunk_range = b"1" if count == 1 else b"1,%d" % count
+    # Prefix every line with "+" in C rather than splitting into a list.
+    return b"".join(
+        [
+            header,
+            b"--- /dev/null\n+++ %s\n@@ -0,0 +%s @@\n+" % (new_name, hunk_range),
+            body.replace(b"\n", b"\n+"),
+            b"\n" if has_final_newline else b"\n\\ No newline at end of file\n",
+        ]
+    )
+
+
+def _untracked_diff_attributes(names: list[str], runner: _GitRunner) -> dict[str, str]:
+    if not names:
+        return {}
+    output = runner(
+        ["check-attr", "-z", "--stdin", "diff"], stdin="\0".join(names) + "\0"
+    )
+    # -z output is "<path>\0diff\0<value>\0" per path.
+    fields = output.split("\0")
+    return {fields[idx]: fields[idx + 2] for idx in range(0, len(fields) - 2, 3)}
+
+
+def _untracked_entry_patch(
+    name: str, file_stat: os.stat_result, diff_attribute: str, *, runner: _GitRunner
+) -> bytes:
+    if stat.S_ISLNK(file_stat.st_mode):
+        # Record the link itself, as git does; never read what it points to.
+        return _untracked_file_patch(
+            name, os.fsencode(os.readlink(name)), file_stat.st_mode
+        )
+    if diff_attribute not in {"set", "unset", "unspecified"}:
+        # A named diff driver may define textconv; leave those files to git.
+        return runner(
+            ["diff", "--no-index", "--", "/dev/null", name],
+            max_output_bytes=_MAX_UNTRACKED_FILE_PATCH_BYTES,
+        ).encode("utf-8")
+    return _untracked_file_patch(
+        name,
+        Path(name).read_bytes(),
+        file_stat.st_mode,
+        is_binary={"set": False, "unset": True}.get(diff_attribute),
+    )
+
+
+def _build_untracked_patch(
+    include_paths: list[str], *, runner: _GitRunner = _run_git_command
+) -> str:
+    names = runner(["ls-files", "-z", "--others", "--exclude-standard"]).split("\0")
+    entries: list[tuple[str, os.stat_result]] = []
     for name in names:
-        if not _matches_include_patterns(name, include_paths):
-            continue
-        file_path = Path(name)
-        if not file_path.is_file():
+        if not name or not _matches_include_patterns(name, include_paths):
             continue
         try:
-            file_size = file_path.stat().st_size
+            file_stat = os.lstat(name)
         except OSError:
             continue
+        if stat.S_ISREG(file_stat.st_mode):
+            file_size = file_stat.st_size
+            if file_size > _MAX_UNTRACKED_FILE_BYTES:
+                raise RuntimeError(
+                    "Refusing to include oversized untracked file "
+                    f"{name!r} ({file_size} bytes). Narrow scope with --include."
+                )
+        elif not stat.S_ISLNK(file_stat.st_mode):
+            continue
+        entries.append((name, file_stat))
+
+    # One check-attr call for the batch so `-diff`, `binary` and diff drivers
+    # from .gitattributes apply as they do for tracked files. Git ignores
+    # them for symlinks.
+    diff_attributes = _untracked_diff_attributes(
+        [name for name, file_stat in entries if stat.S_ISREG(file_stat.st_mode)],
+        runner,
+    )
 
-        if file_size > _MAX_UNTRACKED_FILE_BYTES:
-            raise RuntimeError(
-                "Refusing to include oversized untracked file "
-                f"{name!r} ({file_size} bytes). Narrow scope with --include."
+    # Patches stay bytes until the single decode at the end.
+    buffer = bytearray()
+    for name, file_stat in entries:
+        try:
+            patch_piece = _untracked_entry_patch(
+                name,
+                file_stat,
+                diff_attributes.get(name, "unspecified"),
+                runner=runner,
             )
-
-        patch_text = _run_git_command(
-            ["diff", "--no-index", "--", "/dev/null", str(file_path)],
-            max_output_bytes=_MAX_UNTRACKED_FILE_PATCH_BYTES,
-        )
-        if not patch_text:
+        except OSError:
             continue
 
-        patch_piece = patch_text.rstrip("\n")
-        total_bytes += len(patch_piece.encode("utf-8")) + 2
-        if total_bytes > _MAX_UNTRACKED_PATCH_BYTES:
+        patch_piece = patch_piece.rstrip(b"\n")
+        if len(patch_piece) > _MAX_UNTRACKED_FILE_PATCH_BYTES:
+            raise RuntimeError(
+                "Diff output exceeded safe size budget "
+                f"({_MAX_UNTRACKED_FILE_PATCH_BYTES} bytes). "
+                "Narrow scope with --include."
+            )
+        if buffer:
+            buffer += b"\n\n"
+        buffer += patch_piece
+        if len(buffer) > _MAX_UNTRACKED_PATCH_BYTES:
             raise RuntimeError(
                 "Untracked diff payload exceeded safe size budget "
                 f"({_MAX_UNTRACKED_PATCH_BYTES} bytes). Narrow scope with --include."
             )
-        chunks.append(patch_piece)
-    if not chunks:
+    if not buffer:
         return ""
-    return "\n\n".join(chunks) + "\n"
+    buffer += b"\n"
+    return buffer.decode("utf-8", errors="replace")
 
 
 def build_source_spec(
@@ -116,9 +261,16 @@ def build_source_spec(
     patch_file: Path | None,
     git_range: str | None,
     include_paths: list[str],
+    patch_text: str | None = None,
 ) -> dict[str, Any]:
     if patch_file is not None:
         mode = "patch-file"
+    elif patch_text is not None:
+        # Programmatic callers that already hold the diff; the text travels
+        # with the spec so runtime recomputation needs no file round-trip.
+        # That means an inline context persists the full patch in
+        # source_spec["patch_text"]; the CLI never builds inline specs.
+        mode = "inline"
     elif git_range:
         mode = "git-range"
     else:
@@ -127,38 +279,65 @@ def build_source_spec(
     source_spec: dict[str, Any] = {
         "mode": mode,
         "patch_file": str(patch_file.resolve()) if patch_file is not None else None,
+        "patch_text": patch_text if mode == "inline" else None,
         "git_range": git_range,
         "include_paths": include_paths,
     }
     return source_spec
 
 
-def collect_patch_text_from_source(source_spec: dict[str, Any]) -> str:
+def _normalize_include_pattern(pattern: str) -> str:
+    # Strip "./" and "/" as prefixes; lstrip("./") would also eat the dot of
+    # names like ".github".
+    normalized = pattern.strip()
+    while normalized.startswith("./"):
+        normalized = normalized[2:]
+    return normalized.lstrip("/")
+
+
+@functools.lru_cache(maxsize=32)
+def _git_include_pathspecs(include_paths: tuple[str, ...]) -> tuple[str, ...]:
+    return tuple(
+        f":(glob){normalized}"
+        for pattern in include_paths
+        if (normalized := _normalize_include_pattern(pattern))
+    )
+
+
+def collect_patch_text_from_source(
+    source_spec: dict[str, Any], *, runner: _GitRunner = _run_git_command
+) -> str:
     include_patterns = source_spec["include_paths"]
-    include_pathspecs = [
-        f":(glob){pattern.lstrip('./')}"
-        for pattern in include_patterns
-        if pattern.strip()
-    ]
+    include_pathspecs = _git_include_pathspecs(tuple(include_patterns))
 
     mode = source_spec["mode"]
+    if include_patterns and not include_pathspecs and mode in _GIT_SOURCE_MODES:
+        # Every pattern normalized to nothing, so no path can match; don't
+        # diff and walk the whole tree only to filter all of it out.
+        return ""
+
     if mode == "patch-file":
         raw_patch = _read_patch_file(Path(source_spec["patch_file"]))
+    elif mode == "inline":
+        raw_patch = source_spec["patch_text"]
     elif mode == "git-range":
         args = ["diff", source_spec["git_range"]]
         if include_pathspecs:
             args.extend(["--", *include_pathspecs])
-        raw_patch = _run_git_command(args, max_output_bytes=_MAX_TRACKED_PATCH_BYTES)
+        raw_patch = runner(args, max_output_bytes=_MAX_TRACKED_PATCH_BYTES)
     elif mode == "working-tree":
         args = ["diff", "HEAD"]
         if include_pathspecs:
             args.extend(["--", *include_pathspecs])
-        raw_patch = _run_git_command(args, max_output_bytes=_MAX_TRACKED_PATCH_BYTES)
+        raw_patch = runner(args, max_output_bytes=_MAX_TRACKED_PATCH_BYTES)
     else:
         raise RuntimeError(f"Unsupported source mode: {mode}")
 
-    if include_patterns:
-        untracked_patch = _build_untracked_patch(include_patterns)
+    # Untracked files only belong to a working-tree diff; merging them into a
+    # patch file, inline text or a commit range would mix in unrelated files
+    # and make recomputation depend on the current checkout.
+    if include_patterns and mode == "working-tree":
+        untracked_patch = _build_untracked_patch(include_patterns, runner=runner)
         if untracked_patch:
             if raw_patch and not raw_patch.endswith("\n"):
                 raw_patch += "\n"
@@ -167,34 +346,70 @@ def collect_patch_text_from_source(source_spec: dict[str, Any]) -> str:
     return raw_patch
 
 
-def _matches_include_patterns(path: str, include_paths: list[str]) -> bool:
-    if not include_paths:
-        return True
-
-    normalized = str(PurePosixPath(path)).lstrip("./")
+@functools.lru_cache(maxsize=32)
+def _compile_include_patterns(include_paths: tuple[str, ...]) -> re.Pattern[str]:
+    alternatives: list[str] = []
     for pattern in include_paths:
-        normalized_pattern = pattern.strip().lstrip("./")
+        normalized_pattern = _normalize_include_pattern(pattern)
         if not normalized_pattern:
             continue
         if normalized_pattern.endswith("/**"):
+            # "dir/**" also matches "dir" itself, which fnmatch would not.
             prefix = normalized_pattern[:-3].rstrip("/")
-            if normalized == prefix or normalized.startswith(prefix + "/"):
-                return True
-        if fnmatch.fnmatchcase(normalized, normalized_pattern):
-            return True
-    return False
+            alternatives.append(rf"(?s:{re.escape(prefix)}(?:/.*)?)\Z")
+        alternatives.append(fnmatch.translate(normalized_pattern))
+    if not alternatives:
+        return re.compile(r"(?!)")
+    return re.compile("|".join(alternatives))
+
 
+def _normalize_match_path(path: str) -> str:
+    return str(PurePosixPath(path)).lstrip("/")
+
+
+def _matches_include_patterns(path: str, include_paths: Sequence[str]) -> bool:
+    if not include_paths:
+        return True
+
+    matcher = _compile_include_patterns(tuple(include_paths))
+    return matcher.match(_normalize_match_path(path)) is not None
+
+
+# Set only inside shared_parse_cache(); module-level caching would hand the
+# same mutable FilePatch objects to unrelated callers for the process lifetime.
+_parse_cache: dict[tuple[str, tuple[str, ...]], list[FilePatch]] | None = None
+
+
+@contextlib.contextmanager
+def shared_parse_cache() -> Iterator[None]:
+    # One pipeline run builds the context and then recomputes the runtime from
+    # the same patch; share that parse for the run and drop it afterwards.
+    global _parse_cache
+    previous = _parse_cache
+    _parse_cache = {}
+    try:
+        yield
+    finally:
+        _parse_cache = previous
+
+
+def _parse_files(raw_patch: str, include_paths: tuple[str, ...]) -> list[FilePatch]:
+    cache_key = (raw_patch, include_paths)
+    if _parse_cache is not None and cache_key in _parse_cache:
+        return _parse_cache[cache_key]
 
-def _parse_files(raw_patch: str, include_paths: list[str]) -> list[FilePatch]:
     files = parse_unified_diff(raw_patch)
     if include_paths:
+        matcher = _compile_include_patterns(include_paths)
         files = [
             file
             for file in files
-            if _matches_include_patterns(file.path, include_paths)
+            if matcher.match(_normalize_match_path(file.path)) is not None
         ]
     else:
         files = [file for file in files if not file.is_binary]
+    if _parse_cache is not None:
+        _parse_cache[cache_key] = files
     return files
 
 
@@ -303,9 +518,9 @@ def _build_context_files(files: list[FilePatch]) -> list[dict[str, Any]]:
 
 
 def build_review_context(raw_patch: str, source_spec: dict[str, Any]) -> dict[str, Any]:
-    include_paths = source_spec["include_paths"]
-    files = _parse_files(raw_patch, include_paths)
     diff_fingerprint = hash_text(raw_patch)
+    files = _parse_files(raw_patch, tuple(source_spec["include_paths"]))
+    stats = _stats(files)
     context_files = _build_context_files(files)
 
     context_payload = {
@@ -313,13 +528,17 @@ def build_review_context(raw_patch: str, source_spec: dict[str, Any]) -> dict[st
         "generated_at": utc_now_iso(),
         "source_spec": source_spec,
         "diff_fingerprint": diff_fingerprint,
-        "stats": _stats(files),
+        "stats": stats,
         "files": context_files,
     }
+    # diff_fingerprint already covers inline patch text; don't hash it twice.
+    spec_identity = {
+        key: value for key, value in source_spec.items() if key != "patch_text"
+    }
     context_payload["context_id"] = hash_text(
         json.dumps(
             {
-                "source_spec": source_spec,
+                "source_spec": spec_identity,
                 "diff_fingerprint": diff_fingerprint,
                 "files": [
                     {
@@ -341,15 +560,16 @@ def recompute_runtime_from_context(context: dict[str, Any]) -> dict[str, Any]:
         raise RuntimeError("Context is missing source_spec.")
 
     raw_patch = collect_patch_text_from_source(source_spec)
-    include_paths = source_spec["include_paths"]
-    files = _parse_files(raw_patch, include_paths)
+    files = list(_parse_files(raw_patch, tuple(source_spec["include_paths"])))
     anchor_index: dict[str, dict[str, dict[str, Any]]] = {}
+    hunks_by_anchor: dict[str, Hunk] = {}
     for file_patch in files:
         path = file_patch.path
         file_anchor_map: dict[str, dict[str, Any]] = {}
         for hunk in file_patch.hunks:
             stable_hunk_id = hunk.stable_hunk_id
             anchor_id = hash_text(f"{path}:{stable_hunk_id}")
+            hunks_by_anchor[anchor_id] = hunk
             anchor_line: int | None = None
             additions = 0
             deletions = 0
@@ -357,10 +577,10 @@ def recompute_runtime_from_context(context: dict[str, Any]) -> dict[str, Any]:
                 line_type = line.line_type
                 if line_type == "add":
                     additions += 1
+                    if anchor_line is None:
+                        anchor_line = line.new_line
                 elif line_type == "del":
                     deletions += 1
-                if line_type == "add" and anchor_line is None:
-                    anchor_line = line.new_line
 
             file_anchor_map[anchor_id] = {
                 "anchor_id": anchor_id,
@@ -378,4 +598,5 @@ def recompute_runtime_from_context(context: dict[str, Any]) -> dict[str, Any]:
         "stats": _stats(files),
         "files": files,
         "anchor_index": anchor_index,
+        "hunks_by_anchor": hunks_by_anchor,
     }
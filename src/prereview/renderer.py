@@ -1,11 +1,15 @@
 from __future__ import annotations
 
+import functools
 import html
+import itertools
 import json
+from collections import Counter
+from collections.abc import Iterator
 from importlib import resources
 from typing import Any
 
-from jinja2 import Environment
+from jinja2 import Environment, Template
 
 
 def _line_number(value: int | None) -> str:
@@ -48,7 +52,9 @@ def _normalize_file_summary(path: str, summary: str | None) -> str | None:
 
 def _json_for_html_script(payload: Any) -> str:
     # Avoid closing script tags from embedded JSON text.
-    return json.dumps(payload, sort_keys=True).replace("</", "<\\/")
+    return json.dumps(payload, sort_keys=True, separators=(",", ":")).replace(
+        "</", "<\\/"
+    )
 
 
 def _comments_by_line(
@@ -100,15 +106,17 @@ def _hunk_annotations(
 _TEMPLATE_ENV = Environment(autoescape=True, trim_blocks=True, lstrip_blocks=True)
 
 
-_TEMPLATE_TEXT = (
-    resources.files("prereview")
-    .joinpath("templates/review.html.j2")
-    .read_text(encoding="utf-8")
-)
-_TEMPLATE = _TEMPLATE_ENV.from_string(_TEMPLATE_TEXT)
+@functools.cache
+def _template() -> Template:
+    # Compile on first render so commands that never render skip the cost.
+    return _TEMPLATE_ENV.from_string(
+        resources.files("prereview")
+        .joinpath("templates/review.html.j2")
+        .read_text(encoding="utf-8")
+    )
 
 
-def render_html(
+def render_html_chunks(
     prepared: dict[str, Any],
     annotations: dict[str, Any],
     validation_report: dict[str, Any],
@@ -120,7 +128,7 @@ def render_html(
     notes_error_count: int = 0,
     notes_warning_count: int = 0,
     embedded_data: dict[str, Any] | None = None,
-) -> str:
+) -> Iterator[str]:
     prepared_stats = prepared["stats"]
     files = prepared["files"]
     overview = annotations["overview"]
@@ -130,10 +138,13 @@ def render_html(
         file_annotations[file_annotation["path"]] = file_annotation
 
     issues = validation_report["issues"]
-    error_count = sum(issue["level"] == "error" for issue in issues)
-    warning_count = sum(issue["level"] == "warning" for issue in issues)
+    level_counts = Counter(issue["level"] for issue in issues)
+    error_count = level_counts["error"]
+    warning_count = level_counts["warning"]
 
-    overview_lines = [line for line in overview if line.strip()][:8]
+    overview_lines = list(
+        itertools.islice((line for line in overview if line.strip()), 8)
+    )
 
     issues_render: list[dict[str, str]] = []
     for issue in issues[:25]:
@@ -247,7 +258,8 @@ def render_html(
                         "new_no": _line_number(line["new_line"]),
                         "old_line": line["old_line"],
                         "new_line": line["new_line"],
-                        "raw_content": line["content"],
+                        # Escaped once with quote=True, which is also safe for
+                        # the data-line-content attribute.
                         "content": html.escape(line["content"], quote=True),
                     }
                 )
@@ -285,7 +297,7 @@ def render_html(
         _json_for_html_script(embedded_data) if embedded_data is not None else None
     )
 
-    return _TEMPLATE.render(
+    return _template().generate(
         title=title,
         files_changed=prepared_stats["files_changed"],
         additions=prepared_stats["additions"],
@@ -300,3 +312,32 @@ def render_html(
         files_render=files_render,
         embedded_json=embedded_json,
     )
+
+
+def render_html(
+    prepared: dict[str, Any],
+    annotations: dict[str, Any],
+    validation_report: dict[str, Any],
+    *,
+    title: str,
+    max_expanded_lines: int,
+    collapse_large_hunks: bool,
+    allow_split_hunks: bool,
+    notes_error_count: int = 0,
+    notes_warning_count: int = 0,
+    embedded_data: dict[str, Any] | None = None,
+) -> str:
+    return "".join(
+        render_html_chunks(
+            prepared,
+            annotations,
+            validation_report,
+            title=title,
+            max_expanded_lines=max_expanded_lines,
+            collapse_large_hunks=collapse_large_hunks,
+            allow_split_hunks=allow_split_hunks,
+            notes_error_count=notes_error_count,
+            notes_warning_count=notes_warning_count,
+            embedded_data=embedded_data,
+        )
+    )
@@ -1,11 +1,12 @@
 from __future__ import annotations
 
+import functools
 import json
 from importlib import resources
 from pathlib import Path
 from typing import Any
 
-from jinja2 import Environment
+from jinja2 import Environment, Template
 
 from prereview.models import Severity
 from prereview.util import write_text
@@ -16,11 +17,15 @@ _TEMPLATE_ENV = Environment(
     lstrip_blocks=True,
     keep_trailing_newline=True,
 )
-_REVIEW_INPUT_TEMPLATE = _TEMPLATE_ENV.from_string(
-    resources.files("prereview")
-    .joinpath("templates/review-input.txt.j2")
-    .read_text(encoding="utf-8")
-)
+
+
+@functools.cache
+def _review_input_template() -> Template:
+    return _TEMPLATE_ENV.from_string(
+        resources.files("prereview")
+        .joinpath("templates/review-input.txt.j2")
+        .read_text(encoding="utf-8")
+    )
 
 
 def _warning(code: str, message: str, location: str) -> dict[str, str]:
@@ -86,7 +91,7 @@ def render_review_input(
             }
         )
 
-    return _REVIEW_INPUT_TEMPLATE.render(
+    return _review_input_template().render(
         context_id=context["context_id"],
         diff_fingerprint=context["diff_fingerprint"],
         stats=stats,
@@ -95,9 +100,19 @@ def render_review_input(
     )
 
 
+def _read_notes_text(path: Path, text: str | None) -> str | None:
+    if text is not None:
+        return text
+    if not path.exists():
+        return None
+    return path.read_text(encoding="utf-8")
+
+
 def parse_review_notes_jsonl(
     path: Path,
     context: dict[str, Any],
+    *,
+    text: str | None = None,
 ) -> tuple[dict[str, Any], list[dict[str, str]], list[dict[str, Any]]]:
     issues: list[dict[str, str]] = []
     rejected: list[dict[str, Any]] = []
@@ -106,20 +121,12 @@ def parse_review_notes_jsonl(
     known_paths: set[str] = set()
     anchor_order: list[str] = []
     known_anchors: dict[str, str] = {}
-    for file_entry in context.get("files", []):
-        if not isinstance(file_entry, dict):
-            continue
-        file_path = file_entry.get("path")
-        if not isinstance(file_path, str) or not file_path:
-            continue
+    for file_entry in context["files"]:
+        file_path = file_entry["path"]
         file_order.append(file_path)
         known_paths.add(file_path)
-        for anchor in file_entry.get("anchors", []):
-            if not isinstance(anchor, dict):
-                continue
-            anchor_id = anchor.get("anchor_id")
-            if not isinstance(anchor_id, str) or not anchor_id:
-                continue
+        for anchor in file_entry["anchors"]:
+            anchor_id = anchor["anchor_id"]
             anchor_order.append(anchor_id)
             known_anchors[anchor_id] = file_path
 
@@ -155,10 +162,9 @@ def parse_review_notes_jsonl(
             rejected_entry["raw"] = raw
         rejected.append(rejected_entry)
 
-    if path.exists():
-        for line_no, raw_line in enumerate(
-            path.read_text(encoding="utf-8").splitlines(), start=1
-        ):
+    notes_text = _read_notes_text(path, text)
+    if notes_text is not None:
+        for line_no, raw_line in enumerate(notes_text.splitlines(), start=1):
             stripped = raw_line.strip()
             if not stripped or stripped.startswith("#"):
                 continue
@@ -201,9 +207,9 @@ def parse_review_notes_jsonl(
                 continue
 
             if record_type == "overview":
-                text = record.get("text")
-                if isinstance(text, str) and text.strip():
-                    overview.append(text.strip())
+                overview_text = record.get("text")
+                if isinstance(overview_text, str) and overview_text.strip():
+                    overview.append(overview_text.strip())
                 else:
                     reject_record(
                         line_no=line_no,
@@ -357,9 +363,6 @@ def parse_review_notes_jsonl(
                 record=record,
             )
 
-    context_id = context.get("context_id")
-    target_context_id = context_id if isinstance(context_id, str) else ""
-
     anchor_entries = [
         anchors_by_id[anchor_id]
         for anchor_id in anchor_order
@@ -373,7 +376,7 @@ def parse_review_notes_jsonl(
 
     notes_payload: dict[str, Any] = {
         "version": "1",
-        "target_context_id": target_context_id,
+        "target_context_id": context["context_id"],
         "overview": overview,
         "anchors": anchor_entries,
     }
@@ -395,21 +398,22 @@ def write_rejected_notes_jsonl(path: Path, rejected: list[dict[str, Any]]) -> No
     write_text(path, "\n".join(encoded_lines) + "\n")
 
 
-def rewrite_review_notes_jsonl(path: Path, rejected: list[dict[str, Any]]) -> None:
-    if not rejected or not path.exists():
+def rewrite_review_notes_jsonl(
+    path: Path,
+    rejected: list[dict[str, Any]],
+    *,
+    text: str | None = None,
+) -> None:
+    if not rejected:
         return
-
-    rejected_lines = {
-        line_no for entry in rejected if isinstance(line_no := entry.get("line"), int)
-    }
-    if not rejected_lines:
+    notes_text = _read_notes_text(path, text)
+    if notes_text is None:
         return
 
+    rejected_lines = {entry["line"] for entry in rejected}
     kept_lines = [
         line
-        for line_no, line in enumerate(
-            path.read_text(encoding="utf-8").splitlines(), start=1
-        )
+        for line_no, line in enumerate(notes_text.splitlines(), start=1)
         if line_no not in rejected_lines
     ]
     output = "\n".join(kept_lines)
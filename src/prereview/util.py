@@ -2,10 +2,14 @@ from __future__ import annotations
 
 import hashlib
 import json
+import os
+from collections.abc import Iterable
 from datetime import UTC, datetime
 from pathlib import Path
 from typing import Any
 
+_WRITE_BUFFER_BYTES = 1024 * 1024
+
 
 def hash_text(value: str) -> str:
     return hashlib.sha1(value.encode("utf-8")).hexdigest()
@@ -33,3 +37,20 @@ def load_json(path: Path) -> Any:
 def write_text(path: Path, value: str) -> None:
     ensure_parent(path)
     path.write_text(value, encoding="utf-8")
+
+
+def write_text_chunks(path: Path, chunks: Iterable[str]) -> None:
+    ensure_parent(path)
+    # Chunks are rendered lazily and can fail mid-write, so stream into a
+    # sibling temp file and swap it in only when complete. The large buffer
+    # batches the many small template chunks into few writes.
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with temp_path.open(
+            "w", encoding="utf-8", buffering=_WRITE_BUFFER_BYTES
+        ) as handle:
+            handle.writelines(chunks)
+        os.replace(temp_path, path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
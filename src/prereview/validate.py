@@ -18,84 +18,106 @@ def _ensure_terminal_punctuation(text: str) -> str:
     return f"{trimmed}."
 
 
-def evaluate_annotations(
-    context: Any,
-    annotations: Any,
-    *,
-    strict: bool,
-) -> tuple[dict[str, Any], dict[str, Any] | None]:
-    issues: list[dict[str, str]] = []
+def _file_render_meta(path: str, file_annotation: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "path": path,
+        "breadcrumbs": (
+            file_annotation["breadcrumbs"]
+            if "breadcrumbs" in file_annotation
+            else path.split("/")
+        ),
+        "summary": file_annotation["summary"] if "summary" in file_annotation else None,
+    }
 
-    if not isinstance(context, dict):
-        issues.append(
-            _issue("error", "context_type", "Context must be a JSON object.", "$")
-        )
-        report = {
-            "valid": False,
-            "issues": issues,
-            "stats": {
-                "mapped_anchors": 0,
-                "unmapped_anchors": 0,
-                "files_with_annotations": 0,
-            },
-        }
-        return report, None
 
-    context_id = context.get("context_id")
-    target = (
-        annotations.get("target_context_id") if isinstance(annotations, dict) else None
+def _materialize_anchor(
+    anchor: dict[str, Any], resolved: dict[str, Any]
+) -> dict[str, Any]:
+    what_changed = anchor["what_changed"].strip()
+    why_changed = anchor["why_changed"].strip()
+    reviewer_focus = (
+        anchor["reviewer_focus"].strip() if "reviewer_focus" in anchor else ""
     )
-    if isinstance(context_id, str) and isinstance(target, str) and target != context_id:
-        issues.append(
-            _issue(
-                "error",
-                "context_mismatch",
-                "target_context_id does not match context_id.",
-                "$.target_context_id",
-            )
-        )
+    risk = anchor["risk"].strip() if "risk" in anchor else ""
+    severity = anchor["severity"]
 
-    runtime: dict[str, Any] | None = None
-    try:
-        runtime = recompute_runtime_from_context(context)
-    except RuntimeError as exc:
-        issues.append(
-            _issue(
-                "error",
-                "runtime_recompute_failed",
-                f"Failed to recompute diff from source_spec: {exc}",
-                "$.source_spec",
-            )
-        )
+    note_fields = {
+        "what_changed": _ensure_terminal_punctuation(what_changed),
+        "why_changed": _ensure_terminal_punctuation(why_changed),
+    }
+    if reviewer_focus:
+        note_fields["reviewer_focus"] = _ensure_terminal_punctuation(reviewer_focus)
+    if risk:
+        note_fields["risk"] = _ensure_terminal_punctuation(risk)
 
-    if runtime is not None:
-        expected_fingerprint = context.get("diff_fingerprint")
-        actual_fingerprint = runtime["diff_fingerprint"]
-        if (
-            isinstance(expected_fingerprint, str)
-            and expected_fingerprint != actual_fingerprint
-        ):
-            issues.append(
-                _issue(
-                    "error",
-                    "context_stale",
-                    "Current diff fingerprint does not match context; regenerate context before validating/building.",
-                    "$.diff_fingerprint",
-                )
+    hunk_annotation = {
+        "hunk_id": resolved["hunk_id"],
+        "new_start": resolved["new_start"],
+        "new_end": resolved["new_end"],
+        "title": (anchor["title"] if "title" in anchor else "") or "Review focus",
+        "note_fields": note_fields,
+        # Keep legacy flattened explanation for compatibility with older renderers/tests.
+        "explanation": " ".join(
+            [
+                f"What changed: {note_fields['what_changed']}",
+                f"Why: {note_fields['why_changed']}",
+                *(
+                    [f"Reviewer focus: {note_fields['reviewer_focus']}"]
+                    if "reviewer_focus" in note_fields
+                    else []
+                ),
+                *([f"Risk: {note_fields['risk']}"] if "risk" in note_fields else []),
+            ]
+        ),
+        "comments": [],
+    }
+
+    # Keep line-level notes rare: only materialize for warning/risk anchors.
+    anchor_line = resolved["anchor_line"]
+    if isinstance(anchor_line, int) and severity in {"warning", "risk"}:
+        text_bits = []
+        if reviewer_focus:
+            text_bits.append(
+                f"Reviewer focus: {_ensure_terminal_punctuation(reviewer_focus)}"
             )
+        if risk:
+            text_bits.append(f"Risk: {_ensure_terminal_punctuation(risk)}")
+        if text_bits:
+            hunk_annotation["comments"].append(
+                {
+                    "line_start": anchor_line,
+                    "text": " ".join(text_bits),
+                    "severity": severity,
+                    "author": "prereview",
+                }
+            )
+    return hunk_annotation
+
+
+_EMPTY_WALK_STATS = {
+    "mapped_anchors": 0,
+    "unmapped_anchors": 0,
+    "files_with_annotations": 0,
+}
 
+
+def _walk_annotations(
+    runtime: dict[str, Any],
+    annotations: Any,
+    *,
+    strict: bool,
+    materialize: bool,
+    issues: list[dict[str, str]],
+) -> dict[str, Any]:
     mapped_anchors = 0
     unmapped_anchors = 0
     files_with_annotations = 0
+    file_meta_by_path: dict[str, dict[str, Any]] = {}
+    render_hunks_by_path: dict[str, list[dict[str, Any]]] = {}
 
-    if (
-        runtime is not None
-        and isinstance(annotations, dict)
-        and isinstance(annotations.get("files"), list)
-    ):
-        runtime_file_paths = {
-            file_entry.path: file_entry for file_entry in runtime["files"]
-        }
+    if isinstance(annotations, dict) and isinstance(annotations.get("files"), list):
+        # anchor_index is keyed by every runtime path, so it doubles as the
+        # known-path set.
         anchor_index = runtime["anchor_index"]
 
         for file_idx, file_annotation in enumerate(annotations["files"]):
@@ -107,7 +129,7 @@ def evaluate_annotations(
             if not isinstance(path, str):
                 continue
 
-            if path not in runtime_file_paths:
+            if path not in anchor_index:
                 level = "error" if strict else "warning"
                 issues.append(
                     _issue(
@@ -121,6 +143,10 @@ def evaluate_annotations(
 
             file_anchor_index = anchor_index[path]
             anchors = file_annotation["anchors"] if "anchors" in file_annotation else []
+            if materialize:
+                # Later entries for the same path replace earlier ones.
+                file_meta_by_path[path] = _file_render_meta(path, file_annotation)
+                render_hunks_by_path[path] = []
             for anchor_idx, anchor in enumerate(anchors):
                 if not isinstance(anchor, dict):
                     continue
@@ -140,142 +166,161 @@ def evaluate_annotations(
                     )
                 else:
                     mapped_anchors += 1
+                    if materialize:
+                        render_hunks_by_path[path].append(
+                            _materialize_anchor(anchor, file_anchor_index[anchor_id])
+                        )
 
-    if strict:
-        for issue in issues:
-            if issue["level"] == "warning":
-                issue["level"] = "error"
-
-    report = {
-        "valid": not any(issue["level"] == "error" for issue in issues),
-        "issues": issues,
+    return {
         "stats": {
             "mapped_anchors": mapped_anchors,
             "unmapped_anchors": unmapped_anchors,
             "files_with_annotations": files_with_annotations,
         },
+        "file_meta_by_path": file_meta_by_path,
+        "render_hunks_by_path": render_hunks_by_path,
     }
-    return report, runtime
 
 
-def materialize_annotations_for_render(
-    runtime: dict[str, Any],
-    annotations: dict[str, Any],
+def _render_annotations(
+    runtime: dict[str, Any], annotations: dict[str, Any], walk: dict[str, Any]
 ) -> dict[str, Any]:
-    runtime_files = runtime["files"]
-    anchor_index = runtime["anchor_index"]
-
-    annotations_by_file: dict[str, dict[str, Any]] = {}
-    for file_annotation in annotations["files"]:
-        path = file_annotation["path"]
-        annotations_by_file[path] = {
-            "path": path,
-            "breadcrumbs": (
-                file_annotation["breadcrumbs"]
-                if "breadcrumbs" in file_annotation
-                else path.split("/")
-            ),
-            "summary": file_annotation["summary"]
-            if "summary" in file_annotation
-            else None,
-            "anchors": file_annotation["anchors"],
-        }
-
+    file_meta_by_path = walk["file_meta_by_path"]
+    render_hunks_by_path = walk["render_hunks_by_path"]
     render_files: list[dict[str, Any]] = []
-    for runtime_file in runtime_files:
+    for runtime_file in runtime["files"]:
         path = runtime_file.path
-        file_annotation = (
-            annotations_by_file[path]
-            if path in annotations_by_file
-            else {"breadcrumbs": path.split("/"), "summary": None, "anchors": []}
+        file_meta = (
+            file_meta_by_path[path]
+            if path in file_meta_by_path
+            else {"path": path, "breadcrumbs": path.split("/"), "summary": None}
+        )
+        render_files.append(
+            {
+                **file_meta,
+                "comments": [],
+                "hunks": render_hunks_by_path.get(path, []),
+            }
         )
-        render_file = {
-            "path": path,
-            "breadcrumbs": file_annotation["breadcrumbs"],
-            "summary": file_annotation["summary"],
-            "comments": [],
-            "hunks": [],
+    return {
+        "version": "render-2",
+        "overview": annotations["overview"],
+        "files": render_files,
+    }
+
+
+def _evaluate(
+    context: Any,
+    annotations: Any,
+    *,
+    strict: bool,
+    materialize: bool,
+) -> tuple[dict[str, Any], dict[str, Any] | None, dict[str, Any] | None]:
+    issues: list[dict[str, str]] = []
+
+    if not isinstance(context, dict):
+        issues.append(
+            _issue("error", "context_type", "Context must be a JSON object.", "$")
+        )
+        report = {
+            "valid": False,
+            "issues": issues,
+            "stats": _EMPTY_WALK_STATS.copy(),
         }
+        return report, None, None
 
-        per_file_anchor_index = anchor_index[path]
-        for anchor in file_annotation["anchors"]:
-            anchor_id = anchor["anchor_id"]
-            if anchor_id not in per_file_anchor_index:
-                continue
-            resolved = per_file_anchor_index[anchor_id]
+    context_id = context.get("context_id")
+    target = (
+        annotations.get("target_context_id") if isinstance(annotations, dict) else None
+    )
+    if isinstance(context_id, str) and isinstance(target, str) and target != context_id:
+        issues.append(
+            _issue(
+                "error",
+                "context_mismatch",
+                "target_context_id does not match context_id.",
+                "$.target_context_id",
+            )
+        )
 
-            what_changed = anchor["what_changed"].strip()
-            why_changed = anchor["why_changed"].strip()
-            reviewer_focus = (
-                anchor["reviewer_focus"].strip() if "reviewer_focus" in anchor else ""
+    runtime: dict[str, Any] | None = None
+    try:
+        runtime = recompute_runtime_from_context(context)
+    except RuntimeError as exc:
+        issues.append(
+            _issue(
+                "error",
+                "runtime_recompute_failed",
+                f"Failed to recompute diff from source_spec: {exc}",
+                "$.source_spec",
             )
-            risk = anchor["risk"].strip() if "risk" in anchor else ""
-            severity = anchor["severity"]
+        )
 
-            note_fields = {
-                "what_changed": _ensure_terminal_punctuation(what_changed),
-                "why_changed": _ensure_terminal_punctuation(why_changed),
-            }
-            if reviewer_focus:
-                note_fields["reviewer_focus"] = _ensure_terminal_punctuation(
-                    reviewer_focus
+    if runtime is not None:
+        expected_fingerprint = context.get("diff_fingerprint")
+        actual_fingerprint = runtime["diff_fingerprint"]
+        if (
+            isinstance(expected_fingerprint, str)
+            and expected_fingerprint != actual_fingerprint
+        ):
+            issues.append(
+                _issue(
+                    "error",
+                    "context_stale",
+                    "Current diff fingerprint does not match context; regenerate context before validating/building.",
+                    "$.diff_fingerprint",
                 )
-            if risk:
-                note_fields["risk"] = _ensure_terminal_punctuation(risk)
-
-            hunk_annotation = {
-                "hunk_id": resolved["hunk_id"],
-                "new_start": resolved["new_start"],
-                "new_end": resolved["new_end"],
-                "title": (anchor["title"] if "title" in anchor else "")
-                or "Review focus",
-                "note_fields": note_fields,
-                # Keep legacy flattened explanation for compatibility with older renderers/tests.
-                "explanation": " ".join(
-                    [
-                        f"What changed: {note_fields['what_changed']}",
-                        f"Why: {note_fields['why_changed']}",
-                        *(
-                            [f"Reviewer focus: {note_fields['reviewer_focus']}"]
-                            if "reviewer_focus" in note_fields
-                            else []
-                        ),
-                        *(
-                            [f"Risk: {note_fields['risk']}"]
-                            if "risk" in note_fields
-                            else []
-                        ),
-                    ]
-                ),
-                "comments": [],
-            }
-
-            # Keep line-level notes rare: only materialize for warning/risk anchors.
-            anchor_line = resolved["anchor_line"]
-            if isinstance(anchor_line, int) and severity in {"warning", "risk"}:
-                text_bits = []
-                if reviewer_focus:
-                    text_bits.append(
-                        f"Reviewer focus: {_ensure_terminal_punctuation(reviewer_focus)}"
-                    )
-                if risk:
-                    text_bits.append(f"Risk: {_ensure_terminal_punctuation(risk)}")
-                if text_bits:
-                    hunk_annotation["comments"].append(
-                        {
-                            "line_start": anchor_line,
-                            "text": " ".join(text_bits),
-                            "severity": severity,
-                            "author": "prereview",
-                        }
-                    )
+            )
 
-            render_file["hunks"].append(hunk_annotation)
+    walk = (
+        _walk_annotations(
+            runtime, annotations, strict=strict, materialize=materialize, issues=issues
+        )
+        if runtime is not None
+        else None
+    )
 
-        render_files.append(render_file)
+    if strict:
+        for issue in issues:
+            if issue["level"] == "warning":
+                issue["level"] = "error"
 
-    return {
-        "version": "render-2",
-        "overview": annotations["overview"],
-        "files": render_files,
+    report = {
+        "valid": not any(issue["level"] == "error" for issue in issues),
+        "issues": issues,
+        "stats": walk["stats"] if walk is not None else _EMPTY_WALK_STATS.copy(),
     }
+    if not materialize or runtime is None:
+        return report, runtime, None
+    return report, runtime, _render_annotations(runtime, annotations, walk)
+
+
+def evaluate_annotations(
+    context: Any,
+    annotations: Any,
+    *,
+    strict: bool,
+) -> tuple[dict[str, Any], dict[str, Any] | None]:
+    report, runtime, _ = _evaluate(
+        context, annotations, strict=strict, materialize=False
+    )
+    return report, runtime
+
+
+def evaluate_and_materialize(
+    context: Any,
+    annotations: dict[str, Any],
+    *,
+    strict: bool,
+) -> tuple[dict[str, Any], dict[str, Any] | None, dict[str, Any] | None]:
+    return _evaluate(context, annotations, strict=strict, materialize=True)
+
+
+def materialize_annotations_for_render(
+    runtime: dict[str, Any],
+    annotations: dict[str, Any],
+) -> dict[str, Any]:
+    walk = _walk_annotations(
+        runtime, annotations, strict=False, materialize=True, issues=[]
+    )
+    return _render_annotations(runtime, annotations, walk)
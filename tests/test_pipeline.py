@@ -1,15 +1,23 @@
 from __future__ import annotations
 
+import copy
+import functools
+import json
 import os
+import re
+import shutil
 import subprocess
 import sys
+from collections.abc import Iterator, Sequence
 from pathlib import Path
 
 import pytest
 
 from prereview.annotations import compile_annotations_from_notes
+import prereview.cli as cli_module
 from prereview.cli import build_parser, main
 from prereview.diff_parser import parse_unified_diff
+from prereview.models import FilePatch
 import prereview.prepare as prepare_module
 from prereview.prepare import (
     build_review_context,
@@ -21,8 +29,13 @@ from prereview.review_io import (
     rewrite_review_notes_jsonl,
     render_review_input,
 )
-from prereview.renderer import render_html
-from prereview.validate import evaluate_annotations, materialize_annotations_for_render
+from prereview.util import hash_text, write_text_chunks
+from prereview.renderer import render_html, render_html_chunks
+from prereview.validate import (
+    evaluate_and_materialize,
+    evaluate_annotations,
+    materialize_annotations_for_render,
+)
 
 SAMPLE_PATCH = """diff --git a/src/demo.py b/src/demo.py
 index 1111111..2222222 100644
@@ -46,46 +59,78 @@ index 1111111..2222222 100644
 +    return message
 """
 
+_SAMPLE_PATCH_BYTES = SAMPLE_PATCH.encode("utf-8")
 
-def _context_from_patch(
-    patch: str, *, include_paths: list[str] | None = None
-) -> dict[str, object]:
-    patch_path = Path("/tmp/prereview-context.patch")
-    patch_path.write_text(patch, encoding="utf-8")
+_MISSING_ID_NOTE_LINE = (
+    '{"type":"anchor_note","what_changed":"missing id","why_changed":"missing id"}'
+)
+_UNKNOWN_ANCHOR_NOTE_LINE = (
+    '{"type":"anchor_note","anchor_id":"unknown","what_changed":"x","why_changed":"y"}'
+)
+_VALID_NOTE_LINE_TEMPLATE = '{{"type":"anchor_note","anchor_id":"{anchor_id}","what_changed":"Use temp var","why_changed":"Improve readability"}}'
+
+
+@functools.lru_cache(maxsize=8)
+def _cached_context(patch: str, include_paths: tuple[str, ...]) -> dict[str, object]:
     source_spec = build_source_spec(
-        patch_file=patch_path,
+        patch_file=None,
         git_range=None,
-        include_paths=include_paths or [],
+        include_paths=list(include_paths),
+        patch_text=patch,
     )
     return build_review_context(patch, source_spec)
 
 
+def _context_from_patch(
+    patch: str, *, include_paths: list[str] | None = None
+) -> dict[str, object]:
+    # Callers may mutate the context, hence the deep copy.
+    return copy.deepcopy(_cached_context(patch, tuple(include_paths or [])))
+
+
+@pytest.fixture(scope="session")
+def sample_context_template() -> dict[str, object]:
+    return _cached_context(SAMPLE_PATCH, ())
+
+
+# Shared files live under tmp_path_factory, never at fixed paths, so parallel
+# workers (pytest -n) each get their own copy.
+@pytest.fixture(scope="session")
+def sample_patch_file(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    patch_path = tmp_path_factory.mktemp("prereview") / "change.patch"
+    patch_path.write_bytes(_SAMPLE_PATCH_BYTES)
+    return patch_path
+
+
+@pytest.fixture
+def sample_context(sample_context_template: dict[str, object]) -> dict[str, object]:
+    return copy.deepcopy(sample_context_template)
+
+
+_SAMPLE_OVERVIEW = (
+    "Scope: focused diff under review.",
+    "Primary intent: explain what changed and why.",
+    "Reviewer focus: verify behavioral impact and risk assumptions.",
+)
+
+
+def _sample_anchor_note(anchor_id: str) -> dict[str, object]:
+    return {
+        "anchor_id": anchor_id,
+        "title": "Change focus",
+        "what_changed": "Behavior was adjusted in this change focus.",
+        "why_changed": "To improve correctness and maintainability.",
+        "severity": "note",
+    }
+
+
 def _annotations_from_context(context: dict[str, object]) -> dict[str, object]:
     file_annotations: list[dict[str, object]] = []
-    for file_entry in context.get("files", []):
-        if not isinstance(file_entry, dict):
-            continue
-        path = file_entry.get("path")
-        if not isinstance(path, str) or not path:
-            continue
-
-        anchors: list[dict[str, object]] = []
-        for anchor in file_entry.get("anchors", []):
-            if not isinstance(anchor, dict):
-                continue
-            anchor_id = anchor.get("anchor_id")
-            if not isinstance(anchor_id, str) or not anchor_id:
-                continue
-            anchors.append(
-                {
-                    "anchor_id": anchor_id,
-                    "title": "Change focus",
-                    "what_changed": "Behavior was adjusted in this change focus.",
-                    "why_changed": "To improve correctness and maintainability.",
-                    "severity": "note",
-                }
-            )
-
+    for file_entry in context["files"]:
+        path = file_entry["path"]
+        anchors = [
+            _sample_anchor_note(anchor["anchor_id"]) for anchor in file_entry["anchors"]
+        ]
         file_annotations.append(
             {
                 "path": path,
@@ -97,11 +142,7 @@ def _annotations_from_context(context: dict[str, object]) -> dict[str, object]:
     return {
         "version": "2",
         "target_context_id": context["context_id"],
-        "overview": [
-            "Scope: focused diff under review.",
-            "Primary intent: explain what changed and why.",
-            "Reviewer focus: verify behavioral impact and risk assumptions.",
-        ],
+        "overview": list(_SAMPLE_OVERVIEW),
         "files": file_annotations,
     }
 
@@ -109,71 +150,116 @@ def _annotations_from_context(context: dict[str, object]) -> dict[str, object]:
 def _notes_from_context(context: dict[str, object]) -> dict[str, object]:
     notes_anchors: list[dict[str, object]] = []
     file_summaries: list[dict[str, object]] = []
-    for file_entry in context.get("files", []):
-        if not isinstance(file_entry, dict):
-            continue
-        path = file_entry.get("path")
-        if isinstance(path, str) and path:
-            file_summaries.append(
-                {
-                    "path": path,
-                    "summary": "Focused file update; see anchors for behavior and intent.",
-                }
-            )
-        for anchor in file_entry.get("anchors", []):
-            if not isinstance(anchor, dict):
-                continue
-            anchor_id = anchor.get("anchor_id")
-            if not isinstance(anchor_id, str) or not anchor_id:
-                continue
-            notes_anchors.append(
-                {
-                    "anchor_id": anchor_id,
-                    "what_changed": "Behavior was adjusted in this change focus.",
-                    "why_changed": "To improve correctness and maintainability.",
-                    "title": "Change focus",
-                    "severity": "note",
-                }
-            )
+    for file_entry in context["files"]:
+        file_summaries.append(
+            {
+                "path": file_entry["path"],
+                "summary": "Focused file update; see anchors for behavior and intent.",
+            }
+        )
+        notes_anchors.extend(
+            _sample_anchor_note(anchor["anchor_id"]) for anchor in file_entry["anchors"]
+        )
 
     return {
         "version": "1",
         "target_context_id": context["context_id"],
-        "overview": [
-            "Scope: focused diff under review.",
-            "Primary intent: explain what changed and why.",
-            "Reviewer focus: verify behavioral impact and risk assumptions.",
-        ],
+        "overview": list(_SAMPLE_OVERVIEW),
         "file_summaries": file_summaries,
         "anchors": notes_anchors,
     }
 
 
+_RENDER_OPTIONS = {
+    "max_expanded_lines": 120,
+    "collapse_large_hunks": True,
+    "allow_split_hunks": True,
+}
+
+# (prepared, render_annotations, report), the positional inputs of render_html.
+_RenderInputs = tuple[dict[str, object], dict[str, object], dict[str, object]]
+
+
+def _render_inputs(
+    context: dict[str, object], annotations: dict[str, object]
+) -> _RenderInputs:
+    report, runtime = evaluate_annotations(context, annotations, strict=True)
+    assert report["valid"] is True
+    assert runtime is not None
+
+    render_annotations = materialize_annotations_for_render(runtime, annotations)
+    prepared = {
+        "stats": runtime["stats"],
+        "files": [file_patch.to_dict() for file_patch in runtime["files"]],
+    }
+    return prepared, render_annotations, report
+
+
+def _render_review_html(
+    context: dict[str, object], annotations: dict[str, object], *, title: str
+) -> str:
+    return render_html(
+        *_render_inputs(context, annotations), title=title, **_RENDER_OPTIONS
+    )
+
+
+def _assert_all_present(haystack: str, needles: Sequence[str]) -> None:
+    # One regex pass over the page; overlapping needles fall back to ``in``.
+    found = set(re.findall("|".join(map(re.escape, needles)), haystack))
+    missing = [
+        needle for needle in needles if needle not in found and needle not in haystack
+    ]
+    assert not missing, missing
+
+
+def _assert_none_present(haystack: str, needles: Sequence[str]) -> None:
+    match = re.search("|".join(map(re.escape, needles)), haystack)
+    assert match is None, match.group()
+
+
+@pytest.fixture(scope="session")
+def sample_render_inputs(
+    sample_context_template: dict[str, object],
+) -> _RenderInputs:
+    # Rendering does not mutate its inputs, so they are built (and the file
+    # patches converted with to_dict) once for every read-only render test.
+    context = copy.deepcopy(sample_context_template)
+    return _render_inputs(context, _annotations_from_context(context))
+
+
+@pytest.fixture(scope="session")
+def sample_html(
+    sample_render_inputs: _RenderInputs,
+) -> str:
+    return render_html(*sample_render_inputs, title="Sample review", **_RENDER_OPTIONS)
+
+
 def _anchor_states_for_context(
     context: dict[str, object], *, uncommented: bool
 ) -> dict[str, dict[str, object]]:
     states: dict[str, dict[str, object]] = {}
-    for file_entry in context.get("files", []):
-        if not isinstance(file_entry, dict):
-            continue
-        for anchor in file_entry.get("anchors", []):
-            if not isinstance(anchor, dict):
-                continue
-            anchor_id = anchor.get("anchor_id")
-            if not isinstance(anchor_id, str) or not anchor_id:
-                continue
-            states[anchor_id] = {
+    for file_entry in context["files"]:
+        for anchor in file_entry["anchors"]:
+            states[anchor["anchor_id"]] = {
                 "uncommented": uncommented,
                 "changed_loc": 0,
             }
     return states
 
 
-def test_build_review_context_does_not_store_raw_patch() -> None:
-    context = _context_from_patch(SAMPLE_PATCH)
+def test_build_review_context_does_not_store_raw_patch(
+    sample_patch_file: Path,
+) -> None:
+    source_spec = build_source_spec(
+        patch_file=sample_patch_file, git_range=None, include_paths=[]
+    )
+    context = build_review_context(SAMPLE_PATCH, source_spec)
+
     assert context["version"] == "2"
     assert "context_id" in context
     assert "raw_patch" not in context
+    assert context["source_spec"]["patch_text"] is None
+    assert "diff --git" not in json.dumps(context)
     assert context["stats"]["files_changed"] == 1
     assert context["files"]
     first_file = context["files"][0]
@@ -181,11 +267,44 @@ def test_build_review_context_does_not_store_raw_patch() -> None:
     assert first_file["anchors"]
 
 
-def test_authored_annotations_use_anchor_ids() -> None:
-    context = _context_from_patch(SAMPLE_PATCH)
-    annotations = _annotations_from_context(context)
+def test_build_review_context_reuses_parse_without_sharing_state(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    source_spec = build_source_spec(
+        patch_file=None, git_range="HEAD", include_paths=["src/**"]
+    )
+    parse_calls: list[str] = []
+
+    def counting_parse(raw_patch: str) -> list[FilePatch]:
+        parse_calls.append(raw_patch)
+        return parse_unified_diff(raw_patch)
+
+    monkeypatch.setattr(prepare_module, "parse_unified_diff", counting_parse)
+    with prepare_module.shared_parse_cache():
+        first = build_review_context(SAMPLE_PATCH, source_spec)
+        first["files"][0]["anchors"].clear()
+        second = build_review_context(SAMPLE_PATCH, source_spec)
+
+    assert len(parse_calls) == 1
+    assert second["files"][0]["anchors"]
+    assert second["context_id"] == first["context_id"]
+
+
+def test_context_id_tracks_inline_patch_via_fingerprint(
+    sample_context: dict[str, object],
+) -> None:
+    shifted = _context_from_patch(SAMPLE_PATCH_SHIFTED_HEADER)
+    assert sample_context["diff_fingerprint"] != shifted["diff_fingerprint"]
+    assert sample_context["context_id"] != shifted["context_id"]
+    assert (
+        sample_context["context_id"] == _context_from_patch(SAMPLE_PATCH)["context_id"]
+    )
+
+
+def test_authored_annotations_use_anchor_ids(sample_context: dict[str, object]) -> None:
+    annotations = _annotations_from_context(sample_context)
     assert annotations["version"] == "2"
-    assert annotations["target_context_id"] == context["context_id"]
+    assert annotations["target_context_id"] == sample_context["context_id"]
     assert isinstance(annotations.get("overview"), list)
 
     file_entry = annotations["files"][0]
@@ -200,28 +319,31 @@ def test_authored_annotations_use_anchor_ids() -> None:
     assert "line_start" not in anchor
 
 
-def test_compile_notes_to_annotations_maps_anchors() -> None:
-    context = _context_from_patch(SAMPLE_PATCH)
-    notes = _notes_from_context(context)
-    annotations, issues = compile_annotations_from_notes(context, notes)
+def test_compile_notes_to_annotations_maps_anchors(
+    sample_context: dict[str, object],
+) -> None:
+    notes = _notes_from_context(sample_context)
+    annotations, issues = compile_annotations_from_notes(sample_context, notes)
     assert not any(issue["level"] == "error" for issue in issues)
     assert annotations["version"] == "2"
-    assert annotations["target_context_id"] == context["context_id"]
+    assert annotations["target_context_id"] == sample_context["context_id"]
     assert annotations["files"]
     compiled_anchor = annotations["files"][0]["anchors"][0]
     assert (
-        compiled_anchor["anchor_id"] == context["files"][0]["anchors"][0]["anchor_id"]
+        compiled_anchor["anchor_id"]
+        == sample_context["files"][0]["anchors"][0]["anchor_id"]
     )
     assert "what_changed" in compiled_anchor
     assert "why_changed" in compiled_anchor
     assert compiled_anchor["severity"] == "note"
 
 
-def test_validate_and_materialize_annotations() -> None:
-    context = _context_from_patch(SAMPLE_PATCH)
-    annotations = _annotations_from_context(context)
+def test_validate_and_materialize_annotations(
+    sample_context: dict[str, object],
+) -> None:
+    annotations = _annotations_from_context(sample_context)
 
-    report, runtime = evaluate_annotations(context, annotations, strict=True)
+    report, runtime = evaluate_annotations(sample_context, annotations, strict=True)
     assert report["valid"] is True
     assert runtime is not None
 
@@ -234,13 +356,45 @@ def test_validate_and_materialize_annotations() -> None:
     assert "Why:" in first_hunk["explanation"]
 
 
-def test_materialize_does_not_double_terminal_periods() -> None:
-    context = _context_from_patch(SAMPLE_PATCH)
-    annotations = _annotations_from_context(context)
+def test_evaluate_and_materialize_matches_separate_passes(
+    sample_context: dict[str, object],
+) -> None:
+    annotations = _annotations_from_context(sample_context)
+    annotations["files"][0]["anchors"][0]["severity"] = "warning"
+    annotations["files"][0]["anchors"][0]["risk"] = "Return value changed"
+    # Edge cases both paths must treat alike: a superseded entry for the same
+    # path, an unknown file, and anchors that are not dicts or are unknown.
+    annotations["files"].insert(
+        0, {"path": "src/demo.py", "summary": "Superseded.", "anchors": []}
+    )
+    annotations["files"].append({"path": "missing.py", "anchors": []})
+    annotations["files"][-2]["anchors"] += [
+        "not-a-dict",
+        {"anchor_id": "unknown", "what_changed": "x", "why_changed": "y"},
+    ]
+
+    report, runtime = evaluate_annotations(sample_context, annotations, strict=True)
+    assert runtime is not None
+    expected = materialize_annotations_for_render(runtime, annotations)
+    assert expected["files"][0]["summary"] != "Superseded."
+    assert len(expected["files"][0]["hunks"]) == 1
+
+    fused_report, fused_runtime, render_annotations = evaluate_and_materialize(
+        sample_context, annotations, strict=True
+    )
+    assert fused_runtime is not None
+    assert fused_report == report
+    assert render_annotations == expected
+
+
+def test_materialize_does_not_double_terminal_periods(
+    sample_context: dict[str, object],
+) -> None:
+    annotations = _annotations_from_context(sample_context)
     annotations["files"][0]["anchors"][0]["what_changed"] = "Changed greeting flow."
     annotations["files"][0]["anchors"][0]["why_changed"] = "Keep return path explicit."
 
-    report, runtime = evaluate_annotations(context, annotations, strict=True)
+    report, runtime = evaluate_annotations(sample_context, annotations, strict=True)
     assert report["valid"] is True
     assert runtime is not None
 
@@ -257,11 +411,10 @@ def test_materialize_does_not_double_terminal_periods() -> None:
     assert note_fields["why_changed"] == "Keep return path explicit."
 
 
-def test_validate_fails_on_unknown_anchor() -> None:
-    context = _context_from_patch(SAMPLE_PATCH)
+def test_validate_fails_on_unknown_anchor(sample_context: dict[str, object]) -> None:
     annotations = {
         "version": "2",
-        "target_context_id": context["context_id"],
+        "target_context_id": sample_context["context_id"],
         "overview": ["Scope: 1 file."],
         "files": [
             {
@@ -279,66 +432,55 @@ def test_validate_fails_on_unknown_anchor() -> None:
         ],
     }
 
-    report, _ = evaluate_annotations(context, annotations, strict=True)
+    report, _ = evaluate_annotations(sample_context, annotations, strict=True)
     assert report["valid"] is False
     assert any(issue["code"] == "unknown_anchor" for issue in report["issues"])
 
 
-def test_render_preserves_indentation() -> None:
-    context = _context_from_patch(SAMPLE_PATCH)
-    annotations = _annotations_from_context(context)
-    report, runtime = evaluate_annotations(context, annotations, strict=True)
-    assert report["valid"] is True
-    assert runtime is not None
+def test_validate_warns_on_unknown_file_when_not_strict(
+    sample_context: dict[str, object],
+) -> None:
+    annotations = _annotations_from_context(sample_context)
+    annotations["files"].append({"path": "src/missing.py", "anchors": []})
 
-    render_annotations = materialize_annotations_for_render(runtime, annotations)
-    html = render_html(
-        {
-            "stats": runtime["stats"],
-            "files": [file_patch.to_dict() for file_patch in runtime["files"]],
-        },
-        render_annotations,
-        report,
-        title="Indent",
-        max_expanded_lines=120,
-        collapse_large_hunks=True,
-        allow_split_hunks=True,
+    report, _ = evaluate_annotations(sample_context, annotations, strict=False)
+    unknown = [issue for issue in report["issues"] if issue["code"] == "unknown_file"]
+    assert [issue["level"] for issue in unknown] == ["warning"]
+    assert report["stats"]["mapped_anchors"] == 1
+
+
+def test_render_preserves_indentation(sample_html: str) -> None:
+    _assert_all_present(
+        sample_html,
+        [
+            "white-space: pre;",
+            "class='code'",
+            "<span class='diff-prefix'>+</span>    message = &quot;hi&quot;",
+            "data-line-content='    message = &quot;hi&quot;'",
+            "class='headline-stats'",
+            "class='diff-scroll'",
+            "overflow-y: auto;",
+            "width: 2.2rem;",
+        ],
+    )
+    _assert_none_present(
+        sample_html,
+        [
+            "Mapped notes",
+            "Unmapped notes",
+            "width: 3rem;",
+        ],
     )
-    assert "white-space: pre;" in html
-    assert "class='code'" in html
-    assert "<span class='diff-prefix'>+</span>    message = &quot;hi&quot;" in html
-    assert "class='headline-stats'" in html
-    assert "Mapped notes" not in html
-    assert "Unmapped notes" not in html
-    assert "class='diff-scroll'" in html
-    assert "overflow-y: auto;" in html
-    assert "width: 2.2rem;" in html
-    assert "width: 3rem;" not in html
-
-
-def test_render_line_note_meta_shows_severity_only() -> None:
-    context = _context_from_patch(SAMPLE_PATCH)
-    annotations = _annotations_from_context(context)
+
+
+def test_render_line_note_meta_shows_severity_only(
+    sample_context: dict[str, object],
+) -> None:
+    annotations = _annotations_from_context(sample_context)
     annotations["files"][0]["anchors"][0]["severity"] = "warning"
     annotations["files"][0]["anchors"][0]["reviewer_focus"] = "Check behavior."
 
-    report, runtime = evaluate_annotations(context, annotations, strict=True)
-    assert report["valid"] is True
-    assert runtime is not None
-
-    render_annotations = materialize_annotations_for_render(runtime, annotations)
-    html = render_html(
-        {
-            "stats": runtime["stats"],
-            "files": [file_patch.to_dict() for file_patch in runtime["files"]],
-        },
-        render_annotations,
-        report,
-        title="Line meta",
-        max_expanded_lines=120,
-        collapse_large_hunks=True,
-        allow_split_hunks=True,
-    )
+    html = _render_review_html(sample_context, annotations, title="Line meta")
 
     assert "<h4>" not in html
     assert "class='comment-meta comment-severity-warning'>warning</div>" in html
@@ -347,84 +489,44 @@ def test_render_line_note_meta_shows_severity_only() -> None:
     assert " | L" not in html
 
 
-def test_render_uses_readable_hunk_summary_label() -> None:
-    context = _context_from_patch(SAMPLE_PATCH)
-    annotations = _annotations_from_context(context)
-    report, runtime = evaluate_annotations(context, annotations, strict=True)
-    assert report["valid"] is True
-    assert runtime is not None
-
-    render_annotations = materialize_annotations_for_render(runtime, annotations)
-    html = render_html(
-        {
-            "stats": runtime["stats"],
-            "files": [file_patch.to_dict() for file_patch in runtime["files"]],
-        },
-        render_annotations,
-        report,
-        title="Hunk summary",
-        max_expanded_lines=120,
-        collapse_large_hunks=True,
-        allow_split_hunks=True,
+def test_render_uses_readable_hunk_summary_label(sample_html: str) -> None:
+    _assert_all_present(
+        sample_html,
+        [
+            "<summary><span>Change focus</span>",
+            "+2 / -1",
+        ],
+    )
+    _assert_none_present(
+        sample_html,
+        [
+            "Change +1-3 (from -1-2)",
+            "@@ -1 +1 @@",
+        ],
     )
 
-    assert "<summary><span>Change focus</span>" in html
-    assert "+2 / -1" in html
-    assert "Change +1-3 (from -1-2)" not in html
-    assert "@@ -1 +1 @@" not in html
-
-
-def test_render_hunk_notes_use_structured_labels() -> None:
-    context = _context_from_patch(SAMPLE_PATCH)
-    annotations = _annotations_from_context(context)
-    report, runtime = evaluate_annotations(context, annotations, strict=True)
-    assert report["valid"] is True
-    assert runtime is not None
 
-    render_annotations = materialize_annotations_for_render(runtime, annotations)
-    html = render_html(
-        {
-            "stats": runtime["stats"],
-            "files": [file_patch.to_dict() for file_patch in runtime["files"]],
-        },
-        render_annotations,
-        report,
-        title="Structured notes",
-        max_expanded_lines=120,
-        collapse_large_hunks=True,
-        allow_split_hunks=True,
+def test_render_hunk_notes_use_structured_labels(sample_html: str) -> None:
+    _assert_all_present(
+        sample_html,
+        [
+            "<strong>What changed:</strong>",
+            "<strong>Why:</strong>",
+            "class='hunk-note-row'",
+        ],
     )
 
-    assert "<strong>What changed:</strong>" in html
-    assert "<strong>Why:</strong>" in html
-    assert "class='hunk-note-row'" in html
-
 
-def test_render_summary_deduplicates_filename_prefix() -> None:
-    context = _context_from_patch(SAMPLE_PATCH)
-    annotations = _annotations_from_context(context)
+def test_render_summary_deduplicates_filename_prefix(
+    sample_context: dict[str, object],
+) -> None:
+    annotations = _annotations_from_context(sample_context)
     path = str(annotations["files"][0]["path"])
     annotations["files"][0]["summary"] = (
         f"{path}: Focused update for greeting behavior."
     )
 
-    report, runtime = evaluate_annotations(context, annotations, strict=True)
-    assert report["valid"] is True
-    assert runtime is not None
-
-    render_annotations = materialize_annotations_for_render(runtime, annotations)
-    html = render_html(
-        {
-            "stats": runtime["stats"],
-            "files": [file_patch.to_dict() for file_patch in runtime["files"]],
-        },
-        render_annotations,
-        report,
-        title="Summary dedupe",
-        max_expanded_lines=120,
-        collapse_large_hunks=True,
-        allow_split_hunks=True,
-    )
+    html = _render_review_html(sample_context, annotations, title="Summary dedupe")
 
     assert "Focused update for greeting behavior." in html
     assert f"{path}: Focused update for greeting behavior." not in html
@@ -432,130 +534,111 @@ def test_render_summary_deduplicates_filename_prefix() -> None:
     assert "class='file-dir'>src/</div>" in html
 
 
-def test_render_includes_toc_with_file_and_hunk_links() -> None:
-    context = _context_from_patch(SAMPLE_PATCH)
-    annotations = _annotations_from_context(context)
-    report, runtime = evaluate_annotations(context, annotations, strict=True)
-    assert report["valid"] is True
-    assert runtime is not None
-
-    render_annotations = materialize_annotations_for_render(runtime, annotations)
-    html = render_html(
-        {
-            "stats": runtime["stats"],
-            "files": [file_patch.to_dict() for file_patch in runtime["files"]],
-        },
-        render_annotations,
-        report,
-        title="TOC",
-        max_expanded_lines=120,
-        collapse_large_hunks=True,
-        allow_split_hunks=True,
+def test_render_includes_toc_with_file_and_hunk_links(sample_html: str) -> None:
+    _assert_all_present(
+        sample_html,
+        [
+            "class='toc'",
+            "aria-label='Table of contents'",
+            "href='#file-1'",
+            "href='#file-1-hunk-1'",
+            "data-toc-link='file-1-hunk-1'",
+            "class='toc-link toc-hunk-link'",
+            'classList.toggle("is-active"',
+        ],
     )
 
-    assert "class='toc'" in html
-    assert "aria-label='Table of contents'" in html
-    assert "href='#file-1'" in html
-    assert "href='#file-1-hunk-1'" in html
-    assert "data-toc-link='file-1-hunk-1'" in html
-    assert "class='toc-link toc-hunk-link'" in html
-    assert 'classList.toggle("is-active"' in html
 
+def test_render_includes_reviewer_commenting_ui(sample_html: str) -> None:
+    _assert_all_present(
+        sample_html,
+        [
+            "id='copy-agent-prompt'",
+            "id='reviewer-comment-list'",
+            "id='clear-reviewer-comments'",
+            'copySingleButton.textContent = "Copy Prompt";',
+            "Write reviewer comment text to copy.",
+            "data-comment-trigger='line'",
+            "data-location-key='src/demo.py::",
+            'content: "💬";',
+            "buildAgentPrompt",
+            "buildSingleCommentPrompt",
+            "Address all of the following comments one by one.",
+            "Address the following comment.",
+            "editing existing comment",
+            "findCommentForLine(lineRow)",
+            'saveButton.textContent = existingComment ? "Update" : "Save";',
+            "Click a line number in the diff to add a reviewer comment.",
+        ],
+    )
+    _assert_none_present(
+        sample_html,
+        [
+            "reviewer-comment-buttons",
+            ".line-row.has-reviewer-comment td {",
+            "target_context_id:",
+            " | hunk_id=",
+        ],
+    )
 
-def test_render_includes_reviewer_commenting_ui() -> None:
-    context = _context_from_patch(SAMPLE_PATCH)
-    annotations = _annotations_from_context(context)
-    report, runtime = evaluate_annotations(context, annotations, strict=True)
-    assert report["valid"] is True
-    assert runtime is not None
 
-    render_annotations = materialize_annotations_for_render(runtime, annotations)
-    html = render_html(
-        {
-            "stats": runtime["stats"],
-            "files": [file_patch.to_dict() for file_patch in runtime["files"]],
-        },
-        render_annotations,
-        report,
-        title="Reviewer comments",
-        max_expanded_lines=120,
-        collapse_large_hunks=True,
-        allow_split_hunks=True,
+def test_render_file_sections_are_collapsible_from_header(sample_html: str) -> None:
+    _assert_all_present(
+        sample_html,
+        [
+            "<details class='file toc-target'",
+            "<summary class='file-header'>",
+            "class='file-toggle'",
+            'parent.parentElement.closest("details")',
+        ],
     )
 
-    assert "id='copy-agent-prompt'" in html
-    assert "id='reviewer-comment-list'" in html
-    assert "id='clear-reviewer-comments'" in html
-    assert 'copySingleButton.textContent = "Copy Prompt";' in html
-    assert "Write reviewer comment text to copy." in html
-    assert "reviewer-comment-buttons" not in html
-    assert "data-comment-trigger='line'" in html
-    assert "data-location-key='src/demo.py::" in html
-    assert 'content: "💬";' in html
-    assert ".line-row.has-reviewer-comment td {" not in html
-    assert "buildAgentPrompt" in html
-    assert "buildSingleCommentPrompt" in html
-    assert "Address all of the following comments one by one." in html
-    assert "Address the following comment." in html
-    assert "target_context_id:" not in html
-    assert " | hunk_id=" not in html
-    assert "editing existing comment" in html
-    assert "findCommentForLine(lineRow)" in html
-    assert 'saveButton.textContent = existingComment ? "Update" : "Save";' in html
-    assert "Click a line number in the diff to add a reviewer comment." in html
-
-
-def test_render_file_sections_are_collapsible_from_header() -> None:
-    context = _context_from_patch(SAMPLE_PATCH)
-    annotations = _annotations_from_context(context)
-    report, runtime = evaluate_annotations(context, annotations, strict=True)
-    assert report["valid"] is True
-    assert runtime is not None
 
-    render_annotations = materialize_annotations_for_render(runtime, annotations)
-    html = render_html(
-        {
-            "stats": runtime["stats"],
-            "files": [file_patch.to_dict() for file_patch in runtime["files"]],
-        },
-        render_annotations,
-        report,
-        title="File collapse",
-        max_expanded_lines=120,
-        collapse_large_hunks=True,
-        allow_split_hunks=True,
+def test_render_html_chunks_join_to_rendered_html(
+    sample_render_inputs: _RenderInputs,
+) -> None:
+    prepared, render_annotations, report = sample_render_inputs
+    chunks = list(
+        render_html_chunks(
+            prepared, render_annotations, report, title="Chunks", **_RENDER_OPTIONS
+        )
     )
 
-    assert "<details class='file toc-target'" in html
-    assert "<summary class='file-header'>" in html
-    assert "class='file-toggle'" in html
-    assert 'parent.parentElement.closest("details")' in html
-
+    assert len(chunks) > 1
+    assert "".join(chunks) == render_html(
+        prepared, render_annotations, report, title="Chunks", **_RENDER_OPTIONS
+    )
 
-def test_cli_draft_annotations_subcommand_is_removed() -> None:
-    with pytest.raises(SystemExit) as excinfo:
-        main(["draft-annotations"])
-    assert excinfo.value.code == 2
 
+def test_render_embeds_compact_script_safe_json() -> None:
+    html = render_html(
+        {"stats": {"files_changed": 0, "additions": 0, "deletions": 0}, "files": []},
+        {"overview": [], "files": []},
+        {"issues": []},
+        title="Embedded",
+        **_RENDER_OPTIONS,
+        embedded_data={"note": "</script>", "items": [1, 2]},
+    )
 
-def test_cli_prepare_context_subcommand_is_removed() -> None:
-    with pytest.raises(SystemExit) as excinfo:
-        main(["prepare-context"])
-    assert excinfo.value.code == 2
+    assert '{"items":[1,2],"note":"<\\/script>"}' in html
 
 
-def test_cli_build_subcommand_is_removed() -> None:
+@pytest.mark.parametrize(
+    "subcommand", ["draft-annotations", "prepare-context", "build", "run"]
+)
+def test_cli_removed_subcommand_is_rejected(subcommand: str) -> None:
     with pytest.raises(SystemExit) as excinfo:
-        main(["build"])
+        main([subcommand])
     assert excinfo.value.code == 2
 
 
-def test_render_review_input_uses_markers_and_anchor_ids() -> None:
-    context = _context_from_patch(SAMPLE_PATCH)
+def test_render_review_input_uses_markers_and_anchor_ids(
+    sample_context: dict[str, object],
+) -> None:
     rendered = render_review_input(
-        context,
+        sample_context,
         notes_file="review-notes.jsonl",
-        anchor_states=_anchor_states_for_context(context, uncommented=False),
+        anchor_states=_anchor_states_for_context(sample_context, uncommented=False),
     )
 
     assert "PREREVIEW REVIEW INPUT v1" in rendered
@@ -568,14 +651,15 @@ def test_render_review_input_uses_markers_and_anchor_ids() -> None:
     assert "CONTEXT END" in rendered
 
 
-def test_render_review_input_marks_uncommented_hunks_and_embeds_diff() -> None:
-    context = _context_from_patch(SAMPLE_PATCH)
-    runtime = recompute_runtime_from_context(context)
-    anchor_id = context["files"][0]["anchors"][0]["anchor_id"]
+def test_render_review_input_marks_uncommented_hunks_and_embeds_diff(
+    sample_context: dict[str, object],
+) -> None:
+    runtime = recompute_runtime_from_context(sample_context)
+    anchor_id = sample_context["files"][0]["anchors"][0]["anchor_id"]
     metadata = runtime["anchor_index"]["src/demo.py"][anchor_id]
 
     rendered = render_review_input(
-        context,
+        sample_context,
         notes_file="review-notes.jsonl",
         anchor_states={
             anchor_id: {
@@ -600,11 +684,12 @@ def test_render_review_input_marks_uncommented_hunks_and_embeds_diff() -> None:
     assert "\nSNIPPET " not in rendered
 
 
-def test_render_review_input_marks_commented_hunks_without_diff() -> None:
-    context = _context_from_patch(SAMPLE_PATCH)
-    anchor_id = context["files"][0]["anchors"][0]["anchor_id"]
+def test_render_review_input_marks_commented_hunks_without_diff(
+    sample_context: dict[str, object],
+) -> None:
+    anchor_id = sample_context["files"][0]["anchors"][0]["anchor_id"]
     rendered = render_review_input(
-        context,
+        sample_context,
         notes_file="review-notes.jsonl",
         anchor_states={anchor_id: {"uncommented": False, "changed_loc": 3}},
     )
@@ -614,29 +699,31 @@ def test_render_review_input_marks_commented_hunks_without_diff() -> None:
     assert "\nSNIPPET " in rendered
 
 
-def test_parse_review_notes_jsonl_rejects_invalid_records(tmp_path: Path) -> None:
-    context = _context_from_patch(SAMPLE_PATCH)
-    anchor_id = context["files"][0]["anchors"][0]["anchor_id"]
-    notes_path = tmp_path / "review-notes.jsonl"
-    notes_path.write_text(
+def test_parse_review_notes_jsonl_rejects_invalid_records(
+    sample_context: dict[str, object],
+) -> None:
+    anchor_id = sample_context["files"][0]["anchors"][0]["anchor_id"]
+    # Parse from memory; the path only names rejected locations.
+    notes_text = (
         "\n".join(
             [
                 '{"type":"overview","text":"Scope: greeting refactor."}',
-                '{"type":"anchor_note","what_changed":"x","why_changed":"y"}',
-                '{"type":"anchor_note","anchor_id":"unknown","what_changed":"x","why_changed":"y"}',
-                f'{{"type":"anchor_note","anchor_id":"{anchor_id}","what_changed":"Use temp var","why_changed":"Improve readability"}}',
+                _MISSING_ID_NOTE_LINE,
+                _UNKNOWN_ANCHOR_NOTE_LINE,
+                _VALID_NOTE_LINE_TEMPLATE.format(anchor_id=anchor_id),
                 '{"type":"file_summary","path":"src/demo.py","summary":"Small focused update."}',
                 "this is not json",
             ]
         )
-        + "\n",
-        encoding="utf-8",
+        + "\n"
     )
 
-    notes_payload, issues, rejected = parse_review_notes_jsonl(notes_path, context)
+    notes_payload, issues, rejected = parse_review_notes_jsonl(
+        Path("review-notes.jsonl"), sample_context, text=notes_text
+    )
 
     assert notes_payload["version"] == "1"
-    assert notes_payload["target_context_id"] == context["context_id"]
+    assert notes_payload["target_context_id"] == sample_context["context_id"]
     assert len(notes_payload["overview"]) == 1
     assert len(notes_payload["anchors"]) == 1
     assert notes_payload["anchors"][0]["anchor_id"] == anchor_id
@@ -673,30 +760,38 @@ def test_rewrite_review_notes_jsonl_filters_rejected_lines(tmp_path: Path) -> No
     )
 
 
-def test_cli_run_generates_workspace_and_html(tmp_path: Path) -> None:
-    patch_path = tmp_path / "change.patch"
-    artifacts_dir = tmp_path / "prereview"
-    patch_path.write_text(SAMPLE_PATCH, encoding="utf-8")
+def _expect_files(directory: Path, names: set[str]) -> None:
+    missing = names - set(os.listdir(directory))
+    assert not missing, missing
 
-    assert (
-        main(
-            [
-                "--patch-file",
-                str(patch_path),
-                "--artifacts-dir",
-                str(artifacts_dir),
-            ]
-        )
-        == 0
+
+def _cli_run(patch_file: Path, artifacts_dir: Path) -> int:
+    # Repeated runs over the same patch reuse prepare's memoized context parts,
+    # so only the first CLI test pays for parsing.
+    return main(
+        ["--patch-file", str(patch_file), "--artifacts-dir", str(artifacts_dir)]
     )
 
-    assert (artifacts_dir / ".gitignore").exists()
+
+def test_cli_run_generates_workspace_and_html(
+    tmp_path: Path, sample_patch_file: Path
+) -> None:
+    artifacts_dir = tmp_path / "prereview"
+
+    assert _cli_run(sample_patch_file, artifacts_dir) == 0
+
+    _expect_files(
+        artifacts_dir,
+        {
+            ".gitignore",
+            "review-context.json",
+            "review-input.txt",
+            "review-notes.jsonl",
+            "annotations.json",
+            "review.html",
+        },
+    )
     assert (artifacts_dir / ".gitignore").read_text(encoding="utf-8") == "*\n"
-    assert (artifacts_dir / "review-context.json").exists()
-    assert (artifacts_dir / "review-input.txt").exists()
-    assert (artifacts_dir / "review-notes.jsonl").exists()
-    assert (artifacts_dir / "annotations.json").exists()
-    assert (artifacts_dir / "review.html").exists()
 
     notes_text = (artifacts_dir / "review-notes.jsonl").read_text(encoding="utf-8")
     assert notes_text == ""
@@ -714,7 +809,20 @@ def test_cli_run_generates_workspace_and_html(tmp_path: Path) -> None:
     assert "prereview-embedded-data" in html
 
 
-def test_cli_install_skill_with_target_dir(tmp_path: Path) -> None:
+@pytest.fixture(scope="session")
+def prebuilt_skill_dir(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    target_dir = tmp_path_factory.mktemp("skill-cache")
+    assert main(["install-skill", "--target-dir", str(target_dir)]) == 0
+    return target_dir / "prereview-pipeline"
+
+
+def _relative_files(root: Path) -> list[Path]:
+    return sorted(path.relative_to(root) for path in root.rglob("*"))
+
+
+def test_cli_install_skill_with_target_dir(
+    tmp_path: Path, prebuilt_skill_dir: Path
+) -> None:
     target_dir = tmp_path / "skills-root"
 
     assert main(["install-skill", "--target-dir", str(target_dir)]) == 0
@@ -723,6 +831,7 @@ def test_cli_install_skill_with_target_dir(tmp_path: Path) -> None:
     assert (installed_dir / "SKILL.md").exists()
     assert (installed_dir / "assets" / "annotation-notes.template.json").exists()
     assert (installed_dir / "references" / "annotation-schema.md").exists()
+    assert _relative_files(installed_dir) == _relative_files(prebuilt_skill_dir)
 
 
 def test_cli_install_skill_local_uses_project_root(
@@ -753,10 +862,12 @@ def test_cli_install_skill_requires_target_when_noninteractive(
     assert "target folder" in str(excinfo.value)
 
 
-def test_cli_install_skill_force_overwrites_existing(tmp_path: Path) -> None:
+def test_cli_install_skill_force_overwrites_existing(
+    tmp_path: Path, prebuilt_skill_dir: Path
+) -> None:
     target_dir = tmp_path / "skills-root"
     existing = target_dir / "prereview-pipeline"
-    existing.mkdir(parents=True, exist_ok=True)
+    shutil.copytree(prebuilt_skill_dir, existing)
     (existing / "SKILL.md").write_text("stale", encoding="utf-8")
 
     assert main(["install-skill", "--target-dir", str(target_dir), "--force"]) == 0
@@ -765,39 +876,28 @@ def test_cli_install_skill_force_overwrites_existing(tmp_path: Path) -> None:
     assert "name: prereview-pipeline" in skill_text
 
 
-def test_cli_run_writes_rejected_notes_for_bad_jsonl(tmp_path: Path) -> None:
-    patch_path = tmp_path / "change.patch"
+def test_cli_run_writes_rejected_notes_for_bad_jsonl(
+    tmp_path: Path, sample_patch_file: Path, sample_context: dict[str, object]
+) -> None:
     artifacts_dir = tmp_path / "prereview"
     notes_path = artifacts_dir / "review-notes.jsonl"
-    patch_path.write_text(SAMPLE_PATCH, encoding="utf-8")
 
-    context = _context_from_patch(SAMPLE_PATCH)
-    anchor_id = context["files"][0]["anchors"][0]["anchor_id"]
+    anchor_id = sample_context["files"][0]["anchors"][0]["anchor_id"]
 
     artifacts_dir.mkdir(parents=True, exist_ok=True)
     notes_path.write_text(
         "\n".join(
             [
-                '{"type":"anchor_note","what_changed":"missing id","why_changed":"missing id"}',
-                '{"type":"anchor_note","anchor_id":"unknown","what_changed":"x","why_changed":"y"}',
-                f'{{"type":"anchor_note","anchor_id":"{anchor_id}","what_changed":"Use temp var","why_changed":"Improve readability"}}',
+                _MISSING_ID_NOTE_LINE,
+                _UNKNOWN_ANCHOR_NOTE_LINE,
+                _VALID_NOTE_LINE_TEMPLATE.format(anchor_id=anchor_id),
             ]
         )
         + "\n",
         encoding="utf-8",
     )
 
-    assert (
-        main(
-            [
-                "--patch-file",
-                str(patch_path),
-                "--artifacts-dir",
-                str(artifacts_dir),
-            ]
-        )
-        == 0
-    )
+    assert _cli_run(sample_patch_file, artifacts_dir) == 0
 
     rejected_path = artifacts_dir / "rejected-notes.jsonl"
     assert rejected_path.exists()
@@ -815,43 +915,21 @@ def test_cli_run_writes_rejected_notes_for_bad_jsonl(tmp_path: Path) -> None:
     assert "unknown_anchor_id" not in html
 
 
-def test_cli_no_subcommand_defaults_to_run(tmp_path: Path) -> None:
-    patch_path = tmp_path / "change.patch"
+def test_cli_no_subcommand_defaults_to_run(
+    tmp_path: Path, sample_patch_file: Path
+) -> None:
     artifacts_dir = tmp_path / "prereview"
-    patch_path.write_text(SAMPLE_PATCH, encoding="utf-8")
 
-    assert (
-        main(
-            [
-                "--patch-file",
-                str(patch_path),
-                "--artifacts-dir",
-                str(artifacts_dir),
-            ]
-        )
-        == 0
-    )
+    assert _cli_run(sample_patch_file, artifacts_dir) == 0
     assert (artifacts_dir / "review.html").exists()
 
 
 def test_cli_run_prints_uncommented_loc_and_files(
-    tmp_path: Path, capsys: pytest.CaptureFixture[str]
+    tmp_path: Path, sample_patch_file: Path, capsys: pytest.CaptureFixture[str]
 ) -> None:
-    patch_path = tmp_path / "change.patch"
     artifacts_dir = tmp_path / "prereview"
-    patch_path.write_text(SAMPLE_PATCH, encoding="utf-8")
 
-    assert (
-        main(
-            [
-                "--patch-file",
-                str(patch_path),
-                "--artifacts-dir",
-                str(artifacts_dir),
-            ]
-        )
-        == 0
-    )
+    assert _cli_run(sample_patch_file, artifacts_dir) == 0
 
     stdout = capsys.readouterr().out
     assert "Uncommented hunks: 1" in stdout
@@ -859,10 +937,17 @@ def test_cli_run_prints_uncommented_loc_and_files(
     assert "Uncommented files: src/demo.py" in stdout
 
 
-def test_cli_run_subcommand_is_removed() -> None:
-    with pytest.raises(SystemExit) as excinfo:
-        main(["run"])
-    assert excinfo.value.code == 2
+def test_cli_import_defers_pipeline_modules() -> None:
+    code = (
+        "import sys, prereview.cli; "
+        "loaded = {'jinja2', 'prereview.prepare', 'prereview.renderer'} "
+        "& set(sys.modules); "
+        "print(sorted(loaded))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    )
+    assert proc.stdout.strip() == "[]"
 
 
 def test_cli_default_include_paths_in_run_mode() -> None:
@@ -871,23 +956,71 @@ def test_cli_default_include_paths_in_run_mode() -> None:
     assert args.artifacts_dir == Path("prereview")
 
 
-def test_cli_clean_removes_workspace_outside_git(tmp_path: Path) -> None:
+def test_cli_cached_parser_does_not_leak_appended_includes() -> None:
+    parser = cli_module._cached_parser()
+    assert parser.parse_args(["--include", "src/**"]).include == ["src/**"]
+    assert parser.parse_args([]).include == []
+    assert cli_module._cached_parser() is parser
+
+
+def test_write_text_chunks_keeps_previous_file_when_rendering_fails(
+    tmp_path: Path,
+) -> None:
+    target = tmp_path / "review.html"
+    target.write_text("previous", encoding="utf-8")
+
+    def failing_chunks() -> Iterator[str]:
+        yield "<html>"
+        raise RuntimeError("render failed")
+
+    with pytest.raises(RuntimeError, match="render failed"):
+        write_text_chunks(target, failing_chunks())
+    assert target.read_text(encoding="utf-8") == "previous"
+    assert os.listdir(tmp_path) == ["review.html"]
+
+    write_text_chunks(target, iter(["<html>", "</html>"]))
+    assert target.read_text(encoding="utf-8") == "<html></html>"
+    assert os.listdir(tmp_path) == ["review.html"]
+
+
+def test_cli_clean_removes_workspace_outside_git(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
     artifacts_dir = tmp_path / "prereview"
     artifacts_dir.mkdir(parents=True, exist_ok=True)
     (artifacts_dir / "review.html").write_text("x", encoding="utf-8")
 
-    cwd = Path.cwd()
-    try:
-        os.chdir(tmp_path)
-        assert main(["clean"]) == 0
-    finally:
-        os.chdir(cwd)
+    monkeypatch.chdir(tmp_path)
+    assert main(["clean"]) == 0
 
     assert not artifacts_dir.exists()
 
 
+def test_cli_clean_handles_file_symlink_and_missing_workspace(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+) -> None:
+    (tmp_path / "prereview").write_text("x", encoding="utf-8")
+
+    monkeypatch.chdir(tmp_path)
+    assert main(["clean"]) == 0
+    assert not (tmp_path / "prereview").exists()
+    assert "Removed artifacts workspace" in capsys.readouterr().out
+
+    assert main(["clean"]) == 0
+    assert "No artifacts workspace found" in capsys.readouterr().out
+
+    (tmp_path / "target.txt").write_text("keep", encoding="utf-8")
+    (tmp_path / "target-dir").mkdir()
+    for target in (tmp_path / "target.txt", tmp_path / "target-dir"):
+        (tmp_path / "prereview").symlink_to(target)
+        assert main(["clean"]) == 0
+        assert not (tmp_path / "prereview").is_symlink()
+        assert target.exists()
+        assert "Removed artifacts workspace" in capsys.readouterr().out
+
+
 def test_cli_clean_removes_workspace_and_local_exclude(
-    tmp_path: Path,
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
 ) -> None:
     subprocess.run(["git", "init"], cwd=tmp_path, check=True, capture_output=True)
 
@@ -898,12 +1031,8 @@ def test_cli_clean_removes_workspace_and_local_exclude(
     exclude_path = tmp_path / ".git" / "info" / "exclude"
     exclude_path.write_text("/prereview/\n/keep-me/\n", encoding="utf-8")
 
-    cwd = Path.cwd()
-    try:
-        os.chdir(tmp_path)
-        assert main(["clean"]) == 0
-    finally:
-        os.chdir(cwd)
+    monkeypatch.chdir(tmp_path)
+    assert main(["clean"]) == 0
 
     assert not artifacts_dir.exists()
     updated = exclude_path.read_text(encoding="utf-8")
@@ -911,6 +1040,32 @@ def test_cli_clean_removes_workspace_and_local_exclude(
     assert "/keep-me/" in updated
 
 
+def test_recompute_runtime_reuses_context_parse(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    source_spec = build_source_spec(
+        patch_file=None, git_range=None, include_paths=[], patch_text=SAMPLE_PATCH
+    )
+    parse_calls: list[str] = []
+
+    def counting_parse(raw_patch: str) -> list[FilePatch]:
+        parse_calls.append(raw_patch)
+        return parse_unified_diff(raw_patch)
+
+    monkeypatch.setattr(prepare_module, "parse_unified_diff", counting_parse)
+    with prepare_module.shared_parse_cache():
+        context = build_review_context(SAMPLE_PATCH, source_spec)
+        runtime = recompute_runtime_from_context(context)
+    assert len(parse_calls) == 1
+    assert [entry.path for entry in runtime["files"]] == ["src/demo.py"]
+
+    # Outside a run nothing is cached, so callers never share patch objects.
+    other = recompute_runtime_from_context(context)
+    assert len(parse_calls) == 2
+    assert other["files"][0] is not runtime["files"][0]
+    assert prepare_module._parse_cache is None
+
+
 def test_recompute_runtime_include_paths_filters_to_selected_files() -> None:
     patch = """diff --git a/showcase/out.txt b/showcase/out.txt
 new file mode 100644
@@ -932,15 +1087,7 @@ new file mode 100644
 +print(\"keep\")
 """
 
-    tmp_patch = Path("/tmp/prereview-test-exclude.patch")
-    tmp_patch.write_text(patch, encoding="utf-8")
-
-    source_spec = build_source_spec(
-        patch_file=tmp_patch,
-        git_range=None,
-        include_paths=["src/**"],
-    )
-    context = build_review_context(patch, source_spec)
+    context = _context_from_patch(patch, include_paths=["src/**"])
     runtime = recompute_runtime_from_context(context)
     paths = [entry.path for entry in runtime["files"]]
     assert "src/keep.py" in paths
@@ -948,6 +1095,45 @@ new file mode 100644
     assert "showcase/nested/out2.txt" not in paths
 
 
+def test_only_working_tree_source_merges_untracked_files(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    subprocess.run(["git", "init"], cwd=tmp_path, check=True, capture_output=True)
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "untracked.py").write_text("x = 1\n", encoding="utf-8")
+    patch = """diff --git a/src/keep.py b/src/keep.py
+new file mode 100644
+--- /dev/null
++++ b/src/keep.py
+@@ -0,0 +1 @@
++print(\"keep\")
+"""
+
+    monkeypatch.chdir(tmp_path)
+    source_spec = build_source_spec(
+        patch_file=None, git_range=None, include_paths=["src/**"], patch_text=patch
+    )
+    context = build_review_context(patch, source_spec)
+    report, runtime = evaluate_annotations(
+        context, _annotations_from_context(context), strict=True
+    )
+    assert runtime is not None
+    assert [entry.path for entry in runtime["files"]] == ["src/keep.py"]
+    assert report["valid"], report["issues"]
+
+    captured: list[list[str]] = []
+
+    def fake_run(args: list[str], *, max_output_bytes: int | None = None) -> str:
+        captured.append(args)
+        return patch
+
+    range_spec = build_source_spec(
+        patch_file=None, git_range="HEAD~1..HEAD", include_paths=["src/**"]
+    )
+    prepare_module.collect_patch_text_from_source(range_spec, runner=fake_run)
+    assert captured == [["diff", "HEAD~1..HEAD", "--", ":(glob)src/**"]]
+
+
 def test_parse_handles_mnemonic_and_noindex_prefixes() -> None:
     patch = """diff --git w/src/demo.py w/src/demo.py
 index 1111111..2222222 100644
@@ -969,6 +1155,33 @@ new file mode 100644
     assert "notes.txt" in paths
 
 
+def test_parse_detects_renames_and_deletions() -> None:
+    patch = """diff --git a/src/old.py b/src/new.py
+similarity index 90%
+rename from src/old.py
+rename to src/new.py
+index 1111111..2222222 100644
+--- a/src/old.py
++++ b/src/new.py
+@@ -1 +1 @@
+-old
++new
+diff --git a/src/gone.py b/src/gone.py
+deleted file mode 100644
+--- a/src/gone.py
++++ /dev/null
+@@ -1 +0,0 @@
+-bye
+"""
+    renamed, deleted = parse_unified_diff(patch)
+    assert renamed.path == "src/new.py"
+    assert renamed.old_path == "src/old.py"
+    assert renamed.status == "renamed"
+    assert deleted.path == "src/gone.py"
+    assert deleted.new_path is None
+    assert deleted.status == "deleted"
+
+
 def test_parse_stable_hunk_id_ignores_hunk_line_number_shifts() -> None:
     original_hunk = parse_unified_diff(SAMPLE_PATCH)[0].hunks[0]
     shifted_hunk = parse_unified_diff(SAMPLE_PATCH_SHIFTED_HEADER)[0].hunks[0]
@@ -977,6 +1190,23 @@ def test_parse_stable_hunk_id_ignores_hunk_line_number_shifts() -> None:
     assert original_hunk.stable_hunk_id == shifted_hunk.stable_hunk_id
 
 
+def test_parse_stable_hunk_id_hashes_prefixed_body_lines() -> None:
+    patch = """diff --git a/notes.txt b/notes.txt
+--- a/notes.txt
++++ b/notes.txt
+@@ -1,3 +1,3 @@ section
+ keep
+
+-old
++new
+\\ No newline at end of file
+"""
+    (file_patch,) = parse_unified_diff(patch)
+    (hunk,) = file_patch.hunks
+    base_id = hash_text("section\n keep\n \n-old\n+new")
+    assert hunk.stable_hunk_id == hash_text(f"{base_id}:1")
+
+
 def test_parse_stable_hunk_id_disambiguates_identical_hunks() -> None:
     patch = """diff --git a/src/repeated.py b/src/repeated.py
 index 1111111..2222222 100644
@@ -997,38 +1227,38 @@ index 1111111..2222222 100644
 
 
 def test_recompute_runtime_matches_anchors_across_header_shifts(
-    monkeypatch: pytest.MonkeyPatch,
+    monkeypatch: pytest.MonkeyPatch, sample_context: dict[str, object]
 ) -> None:
-    context = _context_from_patch(SAMPLE_PATCH)
-    expected_anchor_id = context["files"][0]["anchors"][0]["anchor_id"]
+    expected_anchor_id = sample_context["files"][0]["anchors"][0]["anchor_id"]
 
     monkeypatch.setattr(
         prepare_module,
         "collect_patch_text_from_source",
         lambda _source_spec: SAMPLE_PATCH_SHIFTED_HEADER,
     )
-    runtime = recompute_runtime_from_context(context)
+    runtime = recompute_runtime_from_context(sample_context)
     file_anchor_index = runtime["anchor_index"]["src/demo.py"]
 
     assert expected_anchor_id in file_anchor_index
+    hunk = runtime["hunks_by_anchor"][expected_anchor_id]
+    assert (
+        hunk.stable_hunk_id == file_anchor_index[expected_anchor_id]["stable_hunk_id"]
+    )
 
 
-def test_collect_patch_uses_git_pathspec_includes(
-    monkeypatch: pytest.MonkeyPatch,
-) -> None:
+def test_collect_patch_uses_git_pathspec_includes() -> None:
     captured: list[tuple[list[str], int | None]] = []
 
     def fake_run(args: list[str], *, max_output_bytes: int | None = None) -> str:
         captured.append((args, max_output_bytes))
         return ""
 
-    monkeypatch.setattr(prepare_module, "_run_git_command", fake_run)
     source_spec = {
         "mode": "working-tree",
         "include_paths": ["showcase/**", "./tmp/**"],
     }
 
-    patch = prepare_module.collect_patch_text_from_source(source_spec)
+    patch = prepare_module.collect_patch_text_from_source(source_spec, runner=fake_run)
     assert patch == ""
     assert captured[0][0] == [
         "diff",
@@ -1040,6 +1270,43 @@ def test_collect_patch_uses_git_pathspec_includes(
     assert captured[0][1] == prepare_module._MAX_TRACKED_PATCH_BYTES
 
 
+@pytest.mark.parametrize("mode", ["working-tree", "git-range"])
+def test_collect_patch_skips_git_when_includes_normalize_to_nothing(
+    mode: str,
+) -> None:
+    def fake_run(args: list[str], *, max_output_bytes: int | None = None) -> str:
+        raise AssertionError(f"unexpected git call: {args}")
+
+    source_spec = {
+        "mode": mode,
+        "git_range": "HEAD~1..HEAD",
+        "include_paths": ["./", "/"],
+    }
+    assert (
+        prepare_module.collect_patch_text_from_source(source_spec, runner=fake_run)
+        == ""
+    )
+
+
+def test_include_patterns_keep_leading_dot_directories() -> None:
+    captured: list[list[str]] = []
+
+    def fake_run(args: list[str], *, max_output_bytes: int | None = None) -> str:
+        captured.append(args)
+        return ""
+
+    source_spec = {"mode": "working-tree", "include_paths": ["./.github/**"]}
+    prepare_module.collect_patch_text_from_source(source_spec, runner=fake_run)
+
+    assert captured[0] == ["diff", "HEAD", "--", ":(glob).github/**"]
+    assert prepare_module._matches_include_patterns(
+        ".github/workflows/ci.yml", [".github/**"]
+    )
+    assert not prepare_module._matches_include_patterns(
+        "github/workflows/ci.yml", [".github/**"]
+    )
+
+
 def test_build_untracked_patch_rejects_oversized_files(
     tmp_path: Path,
     monkeypatch: pytest.MonkeyPatch,
@@ -1049,15 +1316,139 @@ def test_build_untracked_patch_rejects_oversized_files(
     monkeypatch.chdir(tmp_path)
 
     def fake_run(args: list[str], *, max_output_bytes: int | None = None) -> str:
-        if args == ["ls-files", "--others", "--exclude-standard"]:
-            return "artifact.txt\n"
+        if args == ["ls-files", "-z", "--others", "--exclude-standard"]:
+            return "artifact.txt\0"
         return ""
 
-    monkeypatch.setattr(prepare_module, "_run_git_command", fake_run)
     monkeypatch.setattr(prepare_module, "_MAX_UNTRACKED_FILE_BYTES", 8)
 
     with pytest.raises(RuntimeError, match="oversized untracked file"):
-        prepare_module._build_untracked_patch(["artifact.txt"])
+        prepare_module._build_untracked_patch(["artifact.txt"], runner=fake_run)
+
+
+def test_untracked_file_patch_parses_like_git_no_index(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    files = {
+        "text.txt": b"a\nb\n",
+        "no-newline.txt": b"x",
+        "empty.txt": b"",
+        "blob.bin": b"a\0b",
+        "crlf.txt": b"one\r\ntwo\n",
+        "dir with space/name.txt": b"q\n",
+        "tab\tname.txt": b"t\n",
+        'quote"back\\slash.txt': b"s\n",
+        "caf\u00e9.txt": b"c\n",
+        'bin"ary.bin': b"\0",
+    }
+    for name, data in files.items():
+        Path(name).parent.mkdir(parents=True, exist_ok=True)
+        Path(name).write_bytes(data)
+    Path("run.sh").write_bytes(b"#!/bin/sh\n")
+    Path("run.sh").chmod(0o755)
+    outside = tmp_path.parent / f"{tmp_path.name}-outside.txt"
+    outside.write_bytes(b"SECRET=hunter2\n")
+    Path("link.txt").symlink_to(outside)
+
+    for name in [*files, "run.sh", "link.txt"]:
+        git_proc = subprocess.run(
+            ["git", "diff", "--no-index", "--", "/dev/null", name],
+            check=False,
+            capture_output=True,
+            text=True,
+        )
+        assert git_proc.returncode == 1, git_proc.stderr
+        mode = Path(name).lstat().st_mode
+        data = (
+            os.fsencode(os.readlink(name))
+            if Path(name).is_symlink()
+            else Path(name).read_bytes()
+        )
+        synthetic = prepare_module._untracked_file_patch(name, data, mode).decode(
+            "utf-8"
+        )
+        assert "SECRET" not in synthetic
+        assert [f.to_dict() for f in parse_unified_diff(synthetic)] == [
+            f.to_dict() for f in parse_unified_diff(git_proc.stdout)
+        ], name
+
+
+def test_untracked_patch_handles_non_utf8_file_names(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    subprocess.run(["git", "init"], cwd=tmp_path, check=True, capture_output=True)
+    (tmp_path / "ok.txt").write_text("ok\n", encoding="utf-8")
+    (tmp_path / os.fsdecode(b"bad\xffname.txt")).write_bytes(b"bad\n")
+
+    monkeypatch.chdir(tmp_path)
+    patch = prepare_module._build_untracked_patch(["*.txt"])
+
+    paths = [file_patch.path for file_patch in parse_unified_diff(patch)]
+    assert "ok.txt" in paths
+    # Quoted like git's own output for the byte that is not valid UTF-8.
+    assert 'diff --git "a/bad\\377name.txt" "b/bad\\377name.txt"' in patch
+
+
+def test_untracked_patch_honors_diff_attributes(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    subprocess.run(["git", "init"], cwd=tmp_path, check=True, capture_output=True)
+    subprocess.run(
+        ["git", "config", "diff.upper.textconv", "tr a-z A-Z <"],
+        cwd=tmp_path,
+        check=True,
+    )
+    (tmp_path / ".gitattributes").write_text(
+        "*.dat -diff\n*.bin binary\n*.txt diff\n*.up diff=upper\n",
+        encoding="utf-8",
+    )
+    files = {
+        "a.dat": b"plain text\n",
+        "b.bin": b"plain text\n",
+        "c.txt": b"nul\0inside\n",
+        "d.up": b"shout\n",
+        "e.md": b"untouched\n",
+    }
+    for name, data in files.items():
+        (tmp_path / name).write_bytes(data)
+
+    monkeypatch.chdir(tmp_path)
+    parsed: dict[str, dict[str, object]] = {}
+    for name in files:
+        (entry,) = parse_unified_diff(prepare_module._build_untracked_patch([name]))
+        parsed[name] = entry.to_dict()
+        git_proc = subprocess.run(
+            ["git", "diff", "--no-index", "--", "/dev/null", name],
+            check=False,
+            capture_output=True,
+            text=True,
+        )
+        assert git_proc.returncode == 1, git_proc.stderr
+        (expected,) = parse_unified_diff(git_proc.stdout)
+        assert parsed[name] == expected.to_dict(), name
+    assert parsed["a.dat"]["is_binary"]
+    assert parsed["b.bin"]["is_binary"]
+    assert not parsed["c.txt"]["is_binary"]
+    assert parsed["d.up"]["hunks"][0]["lines"][0]["content"] == "SHOUT"
+
+
+def test_untracked_symlink_records_link_target_not_contents(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    subprocess.run(["git", "init"], cwd=repo, check=True, capture_output=True)
+    outside = tmp_path / "outside_secret.txt"
+    outside.write_text("SECRET=hunter2\n", encoding="utf-8")
+    (repo / "link.txt").symlink_to(outside)
+
+    monkeypatch.chdir(repo)
+    patch = prepare_module._build_untracked_patch(["link.txt"])
+
+    assert "new file mode 120000" in patch
+    assert f"+{outside}" in patch
+    assert "SECRET" not in patch
 
 
 def test_build_review_context_excludes_binary_files_by_default() -> None:
@@ -1075,3 +1466,31 @@ new file mode 100644
     paths = [file_entry["path"] for file_entry in context["files"]]
     assert "src/keep.py" in paths
     assert "assets/logo.bin" not in paths
+
+
+def test_parse_skips_git_binary_patch_payload() -> None:
+    patch = """diff --git a/assets/logo.bin b/assets/logo.bin
+index 1234567..89abcde 100644
+GIT binary patch
+literal 12
+TcmZ?wbhEHbWMp7uXk-8Y2L%BF
+
+literal 0
+HcmV?d00001
+
+diff --git a/src/keep.py b/src/keep.py
+--- a/src/keep.py
++++ b/src/keep.py
+@@ -1 +1 @@
+-print("old")
++print("keep")
+"""
+    binary, text = parse_unified_diff(patch)
+    assert binary.path == "assets/logo.bin"
+    assert binary.is_binary
+    assert binary.hunks == []
+    assert text.path == "src/keep.py"
+    assert [line.content for line in text.hunks[0].lines] == [
+        'print("old")',
+        'print("keep")',
+    ]